@@ -0,0 +1,265 @@
+'''
+Module defining a local fake polygon.io server for offline benchmarks and soak tests
+- Seeded synthetic random-walk sessions (src/utils/synthetic_data.py), identical on every request
+- Replay of responses recorded with POLYGON_RECORD_DIR (see src/http/recorder.py)
+- Aggregates (with next_url pagination), rsi and sma endpoints in the polygon.io response format
+- Configurable latency, error rate and an accelerated session clock capping the served bars
+Usage: python -m src.benchmarks.fake_polygon --start 2024-03-18T13:30 --acceleration 60
+       python -m src.benchmarks.fake_polygon --replay recordings --latency 0.05 --error-rate 0.01
+Point the service at it with POLYGON_BASE_URL=http://127.0.0.1:8765, and the same
+SIMULATION_START and SIMULATION_ACCELERATION when the clock is accelerated
+'''
+
+import argparse
+import asyncio
+import bisect
+import random
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+from aiohttp import web
+from src.http.recorder import load_recordings
+from src.utils.interval_to_ms import interval_to_ms
+from src.utils.market_clock import MarketClock, parse_start
+from src.utils.synthetic_data import (
+    synthetic_bars, sma_values, rsi_values, BAR_FIELDS, DAY_MS, MOCK_SEED
+)
+
+ERROR_STATUSES = (429, 500, 502, 503)
+INDICATOR_WARMUP = 10
+SOURCE = web.AppKey('source', object)
+LATENCY = web.AppKey('latency', float)
+JITTER = web.AppKey('jitter', float)
+ERROR_RATE = web.AppKey('error_rate', float)
+CLOCK = web.AppKey('clock', MarketClock)
+
+def parse_bound(value: str, end_of_day: bool = False) -> int:
+    '''Function that converts a YYYY-MM-DD date or unix millisecond timestamp into milliseconds'''
+    if '-' not in value:
+        return int(value)
+
+    day = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return int(day.timestamp() * 1000) + (DAY_MS - 1 if end_of_day else 0)
+
+class SyntheticSource:
+    '''
+    Class serving seeded random-walk bars and indicators computed on their closes
+    '''
+    def __init__(self, seed: int = MOCK_SEED):
+        self.seed = seed
+
+    def get_bars(
+        self, symbol: str, window: int, interval: str, start: int, end: int
+    ) -> dict:
+        '''Function that returns the bar arrays in [start, end], oldest first'''
+        interval_ms = window * interval_to_ms(interval)
+        return synthetic_bars(start, end, interval_ms, symbol, self.seed)
+
+    def get_indicator(
+        self, indicator: str, symbol: str, timespan: str, window: int, end: int, limit: int
+    ) -> list:
+        '''Function that returns the last limit indicator values up to end, newest first'''
+        interval_ms = interval_to_ms(timespan)
+        count = limit + window * INDICATOR_WARMUP
+        bars = synthetic_bars(end - interval_ms * count, end, interval_ms, symbol, self.seed)
+        if len(bars['c']) <= window:
+            return []
+        if indicator == 'rsi':
+            values = rsi_values(bars['c'], window)
+        else:
+            values = sma_values(bars['c'], window)
+        times = bars['t'][-len(values):]
+
+        return [
+            {'timestamp': time, 'value': round(value, 4)}
+            for time, value in zip(times[::-1][:limit].tolist(), values[::-1][:limit].tolist())
+        ]
+
+class ReplaySource:
+    '''
+    Class serving recorded polygon.io responses
+    Recorded bars and indicator values are merged per series (later recordings win),
+    so any range inside the recorded data can be served, not only the recorded requests
+    '''
+    def __init__(self, directory: str):
+        self.bars = {}
+        self.indicators = {}
+        for recording in load_recordings(directory):
+            parts = urlsplit(recording['request'])
+            path = parts.path.strip('/').split('/')
+            query = dict(parse_qsl(parts.query))
+            body = recording['body']
+            if path[:3] == ['v2', 'aggs', 'ticker']:
+                series = self.bars.setdefault((path[3], int(path[5]), path[6]), {})
+                series.update((bar['t'], bar) for bar in body.get('results', []))
+            elif path[:2] == ['v1', 'indicators']:
+                key = (path[2], path[3], query.get('timespan'), int(query.get('window', 0)))
+                series = self.indicators.setdefault(key, {})
+                values = body.get('results', {}).get('values', [])
+                series.update((value['timestamp'], value) for value in values)
+
+        self.bars = {key: self.sort(series) for key, series in self.bars.items()}
+        self.indicators = {key: self.sort(series) for key, series in self.indicators.items()}
+
+    @staticmethod
+    def sort(series: dict) -> tuple:
+        '''Function that converts a series dictionary into sorted (times, items) lists'''
+        times = sorted(series)
+        return times, [series[time] for time in times]
+
+    def get_bars(
+        self, symbol: str, window: int, interval: str, start: int, end: int
+    ) -> dict:
+        '''Function that returns the recorded bar arrays in [start, end], oldest first'''
+        times, bars = self.bars.get((symbol, window, interval), ([], []))
+        bars = bars[bisect.bisect_left(times, start):bisect.bisect_right(times, end)]
+        return {field: np.array([bar.get(field) for bar in bars]) for field in BAR_FIELDS}
+
+    def get_indicator(
+        self, indicator: str, symbol: str, timespan: str, window: int, end: int, limit: int
+    ) -> list:
+        '''Function that returns the last limit recorded indicator values up to end, newest first'''
+        times, values = self.indicators.get((indicator, symbol, timespan, window), ([], []))
+        last = bisect.bisect_right(times, end)
+        return values[max(0, last - limit):last][::-1]
+
+def session_now(request: web.Request) -> int:
+    '''Function that returns the simulated clock time in milliseconds, unbounded without a clock'''
+    market_clock = request.app[CLOCK]
+    if market_clock is None:
+        return np.iinfo(np.int64).max
+    return int(market_clock.now().timestamp() * 1000)
+
+@web.middleware
+async def simulate_network(request: web.Request, handler) -> web.Response:
+    '''Middleware adding latency and answering a share of requests with retryable errors'''
+    latency, jitter = request.app[LATENCY], request.app[JITTER]
+    if latency or jitter:
+        await asyncio.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+    if random.random() < request.app[ERROR_RATE]:
+        return web.json_response(
+            {'status': 'ERROR', 'request_id': 'simulator', 'error': 'Simulated error'},
+            status=random.choice(ERROR_STATUSES)
+        )
+
+    return await handler(request)
+
+async def get_aggregates(request: web.Request) -> web.Response:
+    '''Handler answering /v2/aggs/ticker/{symbol}/range/{window}/{interval}/{start}/{end}'''
+    symbol = request.match_info['symbol']
+    window = int(request.match_info['window'])
+    start = parse_bound(request.match_info['start'])
+    end = min(parse_bound(request.match_info['end'], True), session_now(request))
+    limit = int(request.query.get('limit', 5000))
+    descending = request.query.get('sort') == 'desc'
+
+    bars = request.app[SOURCE].get_bars(
+        symbol, window, request.match_info['interval'], start, end
+    )
+    if descending:
+        bars = {field: values[::-1] for field, values in bars.items()}
+    truncated = len(bars['t']) > limit
+    bars = {field: values[:limit].tolist() for field, values in bars.items()}
+    results = [dict(zip(bars, values)) for values in zip(*bars.values())]
+
+    response = {
+        'ticker': symbol,
+        'queryCount': len(results),
+        'resultsCount': len(results),
+        'adjusted': True,
+        'results': results,
+        'status': 'OK',
+        'request_id': 'simulator',
+        'count': len(results)
+    }
+    if truncated and not descending:
+        path = request.path.rsplit('/', 2)[0]
+        response['next_url'] = str(request.url.with_path(
+            f'{path}/{results[-1]["t"] + 1}/{request.match_info["end"]}'
+        ).with_query({'sort': 'asc', 'limit': limit}))
+
+    return web.json_response(response)
+
+async def get_indicator(request: web.Request) -> web.Response:
+    '''Handler answering /v1/indicators/{indicator}/{symbol} with values up to timestamp'''
+    end = min(parse_bound(request.query['timestamp'], True), session_now(request))
+    values = request.app[SOURCE].get_indicator(
+        request.match_info['indicator'],
+        request.match_info['symbol'],
+        request.query.get('timespan', 'minute'),
+        int(request.query.get('window', 14)),
+        end,
+        int(request.query.get('limit', 10))
+    )
+
+    return web.json_response({
+        'results': {'values': values},
+        'status': 'OK',
+        'request_id': 'simulator'
+    })
+
+def create_app(
+    source=None, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+    market_clock: MarketClock = None
+) -> web.Application:
+    '''
+    Function that builds the fake polygon.io application
+    source defaults to seeded synthetic sessions, latency and jitter are in seconds,
+    market_clock caps served bars at its current time
+    '''
+    app = web.Application(middlewares=[simulate_network])
+    app[SOURCE] = source or SyntheticSource()
+    app[LATENCY] = latency
+    app[JITTER] = jitter
+    app[ERROR_RATE] = error_rate
+    app[CLOCK] = market_clock
+    app.router.add_get(
+        '/v2/aggs/ticker/{symbol}/range/{window}/{interval}/{start}/{end}', get_aggregates
+    )
+    app.router.add_get('/v1/indicators/{indicator}/{symbol}', get_indicator)
+    return app
+
+async def start_fake_polygon(host: str, port: int, **options) -> web.AppRunner:
+    '''
+    Function that starts the fake polygon.io server, stop it with runner.cleanup()
+    options are passed on to create_app
+    '''
+    runner = web.AppRunner(create_app(**options), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+async def main():
+    '''Function that runs the simulator until interrupted'''
+    parser = argparse.ArgumentParser(description='Local polygon.io simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--replay', help='directory of recorded responses, synthetic when unset')
+    parser.add_argument('--seed', type=int, default=MOCK_SEED, help='synthetic session seed')
+    parser.add_argument('--latency', type=float, default=0.0, help='response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests answered with 429/5xx errors')
+    parser.add_argument('--start', help='simulated ISO start time, bars are capped at the clock')
+    parser.add_argument('--acceleration', type=float, default=1.0,
+                        help='simulated seconds per real second')
+    args = parser.parse_args()
+
+    market_clock = None
+    if args.start or args.acceleration != 1.0:
+        market_clock = MarketClock(
+            parse_start(args.start) if args.start else None, args.acceleration
+        )
+    source = ReplaySource(args.replay) if args.replay else SyntheticSource(args.seed)
+    runner = await start_fake_polygon(
+        args.host, args.port, source=source, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, market_clock=market_clock
+    )
+    print(f'Polygon simulator listening on http://{args.host}:{args.port}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,280 @@
+'''
+Offline benchmark suite for the ingestion cycle and GraphQL query latency
+- Ingestion rounds against a local fake polygon.io server, timed whole and per reported stage
+- getStockData/getStockAnalytics latency and peak memory at several stored bar counts
+- p50/p99 and throughput reports, saved to and compared against a JSON baseline
+MongoDb is an in-process mongomock_motor stand-in, or a local mongod when --mongo-url is set
+(only its marketRoachBenchmark database is used, and dropped)
+Usage: python -m src.benchmarks.run --sizes 1000,100000 --save-baseline baseline.json
+       python -m src.benchmarks.run --sizes 1000,100000 --baseline baseline.json
+'''
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time as clock
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+BENCHMARK_PORT = int(os.environ.get('BENCHMARK_PORT', 8765))
+BENCHMARK_DATABASE = 'marketRoachBenchmark'
+os.environ['POLYGON_BASE_URL'] = f'http://127.0.0.1:{BENCHMARK_PORT}'
+os.environ['IS_MOCKED'] = ''
+os.environ.setdefault('POLYGON_RATE_LIMIT', '1000000')
+os.environ.setdefault('POLYGON_RATE_BURST', '1000000')
+
+# pylint: disable=wrong-import-position
+import numpy as np
+from src.benchmarks.fake_polygon import start_fake_polygon
+from src.cache.bar_buffer import bar_cache
+from src.cache.result_cache import result_cache
+from src.db.indexes import ensure_indexes
+from src.db.mongo_client import MongoClient
+from src.gql.schema import schema
+from src.http.polygon_client import PolygonClient
+from src.processes import market_data
+from src.processes.scheduler import IngestionJob
+from src.processes.seed_mock_data import seed_mock_data
+from src.processes.watermarks import watermark_tracker
+from src.processes.indicators import indicator_engine
+from src.utils.metrics import stage_observers
+
+BENCHMARK_START = datetime(2024, 3, 18, 14, 0, tzinfo=timezone.utc)
+SEED_BATCH_SIZE = 50000
+QUERIES = {
+    'getStockData': '''{
+        getStockData(symbol: "BENCH", start: "%s", end: "%s", interval: "minute") {
+            symbol interval time fetchTime open close highest lowest volume vwap
+            rsi14 sma5 number options details
+        }
+    }''',
+    'getStockData(time,close)': '''{
+        getStockData(symbol: "BENCH", start: "%s", end: "%s", interval: "minute") {
+            time close
+        }
+    }''',
+    'getStockData(maxPoints)': '''{
+        getStockData(
+            symbol: "BENCH", start: "%s", end: "%s", interval: "minute", maxPoints: 1000
+        ) { time open close highest lowest volume }
+    }''',
+    'getStockAnalytics': '''{
+        getStockAnalytics(symbol: "BENCH", start: "%s", end: "%s", interval: "minute") {
+            time expiration type interval details symbol
+        }
+    }'''
+}
+
+class Quiet(contextlib.redirect_stdout):
+    '''Context silencing the prints of benchmarked code'''
+    def __init__(self):
+        super().__init__(io.StringIO())
+
+def summarize(samples: list, items: int = None) -> dict:
+    '''Function that reduces second samples into p50/p99 milliseconds and items/sec throughput'''
+    samples = np.array(samples, dtype=float)
+    summary = {
+        'p50_ms': round(float(np.percentile(samples, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(samples, 99)) * 1000, 3),
+        'runs': len(samples)
+    }
+    if items is not None and samples.sum() > 0:
+        summary['per_sec'] = round(items / float(samples.sum()), 1)
+
+    return summary
+
+async def connect(mongo_url: str):
+    '''Function that connects to the benchmark database and drops it'''
+    if mongo_url:
+        await MongoClient.connect_to_mongodb(mongo_url)
+        MongoClient.database = MongoClient.dbClient[BENCHMARK_DATABASE]
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise SystemExit('mongomock_motor is required without --mongo-url') from e
+        MongoClient.dbClient = AsyncMongoMockClient()
+        MongoClient.database = MongoClient.dbClient[BENCHMARK_DATABASE]
+
+    await reset_database(mongo_url)
+
+async def reset_database(mongo_url: str):
+    '''Function that empties the benchmark database and every in-memory cache'''
+    for name in await MongoClient.database.list_collection_names():
+        await MongoClient.database.drop_collection(name)
+    if mongo_url:
+        with Quiet():
+            await ensure_indexes()
+
+    bar_cache.buffers.clear()
+    result_cache.entries.clear()
+    watermark_tracker.watermarks.clear()
+    watermark_tracker.signatures.clear()
+    indicator_engine.states.clear()
+    indicator_engine.pending.clear()
+
+async def timed(samples: list, awaitable):
+    '''Function that awaits awaitable and appends its duration to samples'''
+    started = clock.perf_counter()
+    result = await awaitable
+    samples.append(clock.perf_counter() - started)
+    return result
+
+async def bench_ingestion(args) -> dict:
+    '''
+    Function that times process_market_data rounds, with the stages they report
+    (polygon fetch, parse, indicators, diff, bulk_write, mongo reads, rollups) recorded per round
+    Every round must write bars, the fake server only serves bars up to each round today
+    '''
+    symbols = [f'BENCH{index}' for index in range(args.symbols)]
+    jobs = [IngestionJob(symbol, 'minute', args.batch_size) for symbol in symbols]
+    stages = {}
+
+    def record_stage(stage: str, target: str, seconds: float, items: int):
+        samples, total = stages.get(f'{stage} {target}', ([], 0))
+        samples.append(seconds)
+        stages[f'{stage} {target}'] = (samples, total + items)
+
+    await reset_database(args.mongo_url)
+    today = BENCHMARK_START
+    rounds = []
+    written = 0
+    stage_observers.append(record_stage)
+    try:
+        with Quiet():
+            for index in range(args.rounds):
+                today += timedelta(minutes=args.round_bars)
+                logs = await timed(
+                    rounds, market_data.process_market_data(jobs, today, args.workers)
+                )
+                if not logs:
+                    raise RuntimeError(f'Ingestion round {index + 1} wrote no bars')
+                written += logs
+    finally:
+        stage_observers.remove(record_stage)
+
+    results = {
+        stage: summarize(samples, items or None)
+        for stage, (samples, items) in sorted(stages.items())
+        if stage.split()[0] != 'ingestion_round'
+    }
+    results['round'] = summarize(rounds, written)
+    return results
+
+async def seed_bars(size: int):
+    '''Function that stores size synthetic minute bars and the analytics detected on them'''
+    end = int(BENCHMARK_START.timestamp() * 1000)
+    start = end - size * 60000
+    with Quiet():
+        await seed_mock_data(
+            ['BENCH'], 'minute', str(start), str(end - 1), insert=True,
+            batch_size=SEED_BATCH_SIZE, with_rollups=False
+        )
+
+    return str(start), str(end)
+
+async def run_query(query: str) -> float:
+    '''Function that executes a query on an empty result cache, returns its duration in seconds'''
+    result_cache.entries.clear()
+    started = clock.perf_counter()
+    result = await schema.execute(query)
+    duration = clock.perf_counter() - started
+    if result.errors:
+        raise RuntimeError(result.errors)
+    return duration
+
+async def bench_queries(args) -> dict:
+    '''Function that times queries and their peak memory for every stored bar count'''
+    results = {}
+    for size in args.sizes:
+        await reset_database(args.mongo_url)
+        start, end = await seed_bars(size)
+        size_results = {}
+        for cached in (False, True):
+            if cached:
+                with Quiet():
+                    await bar_cache.fill([('BENCH', 'minute')])
+            for name, template in QUERIES.items():
+                query = template % (start, end)
+                samples = [await run_query(query) for _ in range(args.repeat)]
+                tracemalloc.start()
+                await run_query(query)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                label = f'{name} [bar cache]' if cached else name
+                size_results[label] = {
+                    **summarize(samples), 'peak_mb': round(peak / 2 ** 20, 2)
+                }
+        results[str(size)] = size_results
+
+    return results
+
+def print_report(results: dict, baseline: dict = None, prefix: str = ''):
+    '''Function that prints results, with the p50 change against baseline when available'''
+    for name, value in results.items():
+        if 'p50_ms' not in value:
+            print(f'{prefix}{name}')
+            print_report(value, (baseline or {}).get(name), prefix + '  ')
+            continue
+
+        line = f'{prefix}{name:<40} p50 {value["p50_ms"]:>10.3f} ms  p99 {value["p99_ms"]:>10.3f} ms'
+        if 'per_sec' in value:
+            line += f'  {value["per_sec"]:>12.1f} /s'
+        if 'peak_mb' in value:
+            line += f'  peak {value["peak_mb"]:>8.2f} MB'
+        if baseline and name in baseline and baseline[name].get('p50_ms'):
+            change = (value['p50_ms'] / baseline[name]['p50_ms'] - 1) * 100
+            line += f'  ({change:+.1f}% p50 vs baseline)'
+        print(line)
+
+async def main():
+    '''Benchmark command entry point'''
+    parser = argparse.ArgumentParser(description='Offline ingestion and query benchmarks')
+    parser.add_argument('--sizes', default='1000,100000,1000000',
+                        help='comma separated stored bar counts for query benchmarks')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per query and size')
+    parser.add_argument('--symbols', type=int, default=10, help='symbols per ingestion round')
+    parser.add_argument('--rounds', type=int, default=20, help='ingestion rounds')
+    parser.add_argument('--round-bars', type=int, default=5, help='new bars per symbol per round')
+    parser.add_argument('--batch-size', type=int, default=1000, help='first round bars per symbol')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent ingestion jobs')
+    parser.add_argument('--skip', choices=('ingestion', 'queries'), help='benchmark to skip')
+    parser.add_argument('--mongo-url', default=os.environ.get('BENCHMARK_MONGO_URL'),
+                        help='local mongod url, in-process mongomock_motor when unset')
+    parser.add_argument('--baseline', help='baseline JSON file to compare against')
+    parser.add_argument('--save-baseline', help='JSON file to save results to')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',')]
+
+    runner = await start_fake_polygon('127.0.0.1', BENCHMARK_PORT)
+    await PolygonClient.open_session()
+    await connect(args.mongo_url)
+    results = {}
+    try:
+        if args.skip != 'ingestion':
+            results['ingestion'] = await bench_ingestion(args)
+        if args.skip != 'queries':
+            results['queries'] = await bench_queries(args)
+    finally:
+        await PolygonClient.close_session()
+        await runner.cleanup()
+        if args.mongo_url:
+            await MongoClient.database.client.drop_database(BENCHMARK_DATABASE)
+        await MongoClient.close_mongodb_connection()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f'Baseline saved - {args.save_baseline}')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,280 @@
+'''
+Module defining the in-memory cache of recent bars
+- Columnar ring buffer of the most recent bars per (symbol, interval)
+- Buffer filling from MongoDb and in-place updates from ingestion
+- Range reads served from memory, falling back to MongoDb for older data
+- Columnar range reads for series responses
+- Batched range reads of several symbols, with one MongoDb query for uncached symbols
+'''
+
+import os
+from bisect import bisect_left, bisect_right
+from contextlib import aclosing
+import numpy as np
+from src.db.aggregate_logs import stream_aggregate_logs, stream_symbols_aggregate_logs
+from src.db.bar_buckets import (
+    FLOAT_FIELDS, INT_FIELDS, TEXT_FIELDS, MISSING_INT, columns_to_logs
+)
+from src.utils.metrics import BAR_CACHE_READS
+from src.utils.structured_log import log_event
+
+BAR_CACHE_MEMORY_MB = int(os.environ.get('BAR_CACHE_MEMORY_MB', 64))
+# Text columns only hold references, the strings they point to are budgeted per row:
+# options carries the polygon request ids of up to three sources, details is usually empty
+TEXT_ROW_BYTES = int(os.environ.get('BAR_CACHE_TEXT_ROW_BYTES', 256))
+ROW_BYTES = 8 * (len(FLOAT_FIELDS) + len(INT_FIELDS) + len(TEXT_FIELDS)) + TEXT_ROW_BYTES
+SERIES_FIELDS = ('time',) + FLOAT_FIELDS
+
+class BarBuffer:
+    '''
+    Class handling the most recent bars of one series as fixed-size NumPy columns
+    - Append, update in place or insert bars by time
+    - Binary search time ranges
+    '''
+    def __init__(self, symbol: str, interval: str, capacity: int):
+        self.symbol = symbol
+        self.interval = interval
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.loaded = False
+        self.pending = []
+        self.covered_from = 0
+        self.columns = {field: np.full(capacity, np.nan) for field in FLOAT_FIELDS}
+        self.columns.update({field: np.full(capacity, MISSING_INT) for field in INT_FIELDS})
+        self.columns.update({field: np.full(capacity, '', dtype=object) for field in TEXT_FIELDS})
+
+    def physical(self, index):
+        '''Function that maps logical indexes (oldest first) to array positions'''
+        return (self.start + index) % self.capacity
+
+    def time_at(self, index: int) -> int:
+        '''Function that returns the bar time at a logical index'''
+        return int(self.columns['time'][self.physical(index)])
+
+    def covers(self, start: int) -> bool:
+        '''Function that checks whether every stored bar from start onwards is buffered'''
+        return self.loaded and start >= self.covered_from
+
+    def write(self, position: int, log: dict):
+        '''Function that sets the fields present in log at an array position'''
+        for field, column in self.columns.items():
+            value = log.get(field)
+            if value is None:
+                continue
+            column[position] = int(value) if field in INT_FIELDS else value
+
+    def clear(self, position: int):
+        '''Function that resets an array position to missing values'''
+        for field, column in self.columns.items():
+            column[position] = '' if field in TEXT_FIELDS else \
+                MISSING_INT if field in INT_FIELDS else np.nan
+
+    def evict_oldest(self):
+        '''Function that drops the oldest bar, the window now starts at the next one'''
+        self.start = self.physical(1)
+        self.size -= 1
+        if self.size:
+            self.covered_from = max(self.covered_from, self.time_at(0))
+
+    def upsert(self, log: dict):
+        '''
+        Function that appends, updates or inserts a bar in time order
+        Bars older than the buffered window are dropped, reads reaching them go to MongoDb
+        '''
+        time = int(log['time'])
+        if self.size and time < self.time_at(0):
+            self.covered_from = max(self.covered_from, time + 1)
+            return
+
+        if not self.size or time > self.time_at(self.size - 1):
+            if self.size == self.capacity:
+                self.evict_oldest()
+            position = self.physical(self.size)
+            self.clear(position)
+            self.write(position, log)
+            self.size += 1
+            return
+
+        index = bisect_left(range(self.size), time, key=self.time_at)
+        if self.time_at(index) == time:
+            self.write(self.physical(index), log)
+            return
+
+        if self.size == self.capacity:
+            self.evict_oldest()
+            index -= 1
+        moved = self.physical(np.arange(index, self.size))
+        for column in self.columns.values():
+            column[self.physical(np.arange(index + 1, self.size + 1))] = column[moved]
+        position = self.physical(index)
+        self.clear(position)
+        self.write(position, log)
+        self.size += 1
+
+    def get_range_arrays(self, start: int, end: int) -> dict:
+        '''Function that returns the columns of bars within [start, end], oldest first'''
+        first = bisect_left(range(self.size), start, key=self.time_at)
+        last = bisect_right(range(self.size), end, key=self.time_at)
+        positions = self.physical(np.arange(first, last))
+        return {field: column[positions] for field, column in self.columns.items()}
+
+    def get_range(self, start: int, end: int) -> list:
+        '''Function that returns bars within [start, end] as logs, newest first'''
+        return columns_to_logs(self.get_range_arrays(start, end), self.symbol, self.interval)
+
+class BarBufferCache:
+    '''
+    Class handling bar buffers of every cached series
+    - Fill buffers from MongoDb within a fixed memory budget
+    - Update buffers with freshly upserted logs, queued until a buffer is loaded
+    '''
+    def __init__(self, memory_mb: int = BAR_CACHE_MEMORY_MB):
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.buffers = {}
+
+    def get(self, symbol: str, interval: str) -> BarBuffer:
+        '''Function that returns the buffer of a series, if cached'''
+        return self.buffers.get((symbol, interval))
+
+    async def fill(self, series: list):
+        '''Function that creates and loads buffers for (symbol, interval) pairs'''
+        capacity = max(1, self.memory_bytes // (max(1, len(series)) * ROW_BYTES))
+        for symbol, interval in series:
+            self.buffers[(symbol, interval)] = BarBuffer(symbol, interval, capacity)
+
+        for symbol, interval in series:
+            buffer = self.buffers[(symbol, interval)]
+            logs = []
+            async with aclosing(stream_aggregate_logs(
+                symbol, '0', str(np.iinfo(np.int64).max), interval, False
+            )) as stream:
+                async for log in stream:
+                    logs.append(log)
+                    if len(logs) >= capacity:
+                        break
+
+            for log in reversed(logs):
+                buffer.upsert(log)
+            if len(logs) >= capacity:
+                buffer.covered_from = buffer.time_at(0)
+            for log in buffer.pending:
+                buffer.upsert(log)
+            buffer.pending = []
+            buffer.loaded = True
+            log_event('bar_cache_loaded', symbol=symbol, interval=interval, bars=buffer.size)
+
+    def update(self, logs: list):
+        '''Function that applies upserted logs to the buffers of their series'''
+        for log in logs:
+            buffer = self.buffers.get((log['symbol'], log['interval']))
+            if buffer is None:
+                continue
+            if buffer.loaded:
+                buffer.upsert(log)
+            else:
+                buffer.pending.append(log)
+
+    def stats(self) -> dict:
+        '''Function that returns the number of buffered series and bars'''
+        return {
+            'series': len(self.buffers),
+            'bars': sum(buffer.size for buffer in self.buffers.values())
+        }
+
+async def stream_cached_aggregate_logs(
+    symbol: str, start: str, end: str, interval: str, is_mocked: bool, fields: tuple = None
+):
+    '''
+    Async generator that streams aggregate data within specified range for symbol, newest first
+    Bars inside the buffered window come from memory, only older bars are read from MongoDb
+    fields limits the fields read from MongoDb, buffered bars are returned whole
+    '''
+    buffer = bar_cache.get(symbol, interval)
+    if is_mocked is True or buffer is None or not buffer.loaded:
+        BAR_CACHE_READS.labels('miss').inc()
+        async for log in stream_aggregate_logs(
+            symbol, start, end, interval, is_mocked, fields=fields
+        ):
+            yield log
+        return
+
+    covered = buffer.covers(int(start))
+    BAR_CACHE_READS.labels('hit' if covered else 'partial').inc()
+    for log in buffer.get_range(int(start), int(end)):
+        yield log
+
+    if not covered:
+        older_end = str(min(int(end), buffer.covered_from - 1))
+        async for log in stream_aggregate_logs(
+            symbol, start, older_end, interval, False, fields=fields
+        ):
+            yield log
+
+async def get_cached_symbols_aggregate_logs(
+    symbols: list, start: str, end: str, interval: str, is_mocked: bool, fields: tuple = None
+) -> dict:
+    '''
+    Function that retrieves aggregate data within specified range for several symbols,
+    returned as lists of logs per symbol, newest first
+    Symbols whose buffer covers the range are read from memory, all others through one query
+    '''
+    logs_per_symbol = {symbol: [] for symbol in symbols}
+    uncached = []
+    for symbol in symbols:
+        buffer = bar_cache.get(symbol, interval)
+        if is_mocked is not True and buffer is not None and buffer.covers(int(start)):
+            BAR_CACHE_READS.labels('hit').inc()
+            logs_per_symbol[symbol] = buffer.get_range(int(start), int(end))
+        else:
+            BAR_CACHE_READS.labels('miss').inc()
+            uncached.append(symbol)
+
+    if uncached:
+        async for log in stream_symbols_aggregate_logs(
+            uncached, start, end, interval, is_mocked, fields=fields
+        ):
+            logs_per_symbol[log['symbol']].append(log)
+
+    return logs_per_symbol
+
+def arrays_to_columns(arrays: dict) -> dict:
+    '''Function that converts buffer arrays into series columns with None for missing values'''
+    columns = {'time': [str(time) for time in arrays['time'].tolist()]}
+    for field in FLOAT_FIELDS:
+        values = arrays[field].astype(object)
+        values[np.isnan(arrays[field])] = None
+        columns[field] = values.tolist()
+
+    return columns
+
+async def get_cached_aggregate_columns(
+    symbol: str, start: str, end: str, interval: str, is_mocked: bool, fields: tuple = None
+) -> dict:
+    '''
+    Function that retrieves aggregate data within specified range for symbol as columns, oldest first
+    Buffered bars are sliced as arrays, only bars older than the buffer are read row by row
+    fields limits the fields read from MongoDb, unread columns are filled with None
+    '''
+    buffer = bar_cache.get(symbol, interval)
+    if is_mocked is not True and buffer is not None and buffer.loaded:
+        columns = arrays_to_columns(buffer.get_range_arrays(int(start), int(end)))
+        if buffer.covers(int(start)):
+            BAR_CACHE_READS.labels('hit').inc()
+            return columns
+        BAR_CACHE_READS.labels('partial').inc()
+        end = str(min(int(end), buffer.covered_from - 1))
+    else:
+        BAR_CACHE_READS.labels('miss').inc()
+        columns = {field: [] for field in SERIES_FIELDS}
+
+    older = {field: [] for field in SERIES_FIELDS}
+    async for log in stream_aggregate_logs(
+        symbol, start, end, interval, is_mocked, fields=fields
+    ):
+        for field, values in older.items():
+            values.append(log.get(field))
+
+    return {field: older[field][::-1] + columns[field] for field in SERIES_FIELDS}
+
+bar_cache = BarBufferCache()
@@ -0,0 +1,138 @@
+'''
+Module defining the resolver result cache
+- Single-flight coalescing of concurrent identical loads
+- Bounded LRU of results with TTL expiration
+- Invalidation of cached ranges touched by ingestion writes
+'''
+
+import asyncio
+import os
+import time as clock
+from collections import OrderedDict
+from src.utils.interval_to_ms import interval_to_ms
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 1024))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 30))
+
+def key_series(key: tuple) -> list:
+    '''
+    Function that lists the (symbol, interval) series of a key, key[1] may hold several symbols
+    Both the requested interval and the stored series it resolves to (ingested, rollup or
+    aggregated on read) are listed, so that writes to either reach aliases and computed intervals
+    '''
+    # pylint: disable=import-outside-toplevel
+    from src.processes.rollups import resolve_interval_source
+
+    symbols = key[1] if isinstance(key[1], tuple) else (key[1],)
+    intervals = dict.fromkeys((key[4], resolve_interval_source(key[4])[1]))
+    return [(symbol, interval) for symbol in symbols for interval in intervals]
+
+def key_first_time(key: tuple) -> int:
+    '''
+    Function that returns the first time a key's result depends on, one requested interval
+    before its start since the bucket containing start is included
+    '''
+    return int(key[2]) - (interval_to_ms(key[4]) or 0)
+
+class ResultCache:
+    '''
+    Class handling cached resolver results keyed by (query, symbol(s), start, end, interval)
+    Entries and generations are tracked per series the key reads (see key_series)
+    - Share one in-flight load between concurrent identical requests
+    - Keep the most recently used results until they expire
+    - Invalidate results whose range contains newly written data
+    '''
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_load(self, key: tuple, loader):
+        '''
+        Function that returns the cached result for key, or awaits loader() once for all callers
+        Results of loads that overlapped an invalidation of their series are not stored,
+        callers waiting on a cancelled load run it again themselves
+        '''
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value, _ = entry
+            if expires_at > clock.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+
+        if key in self.in_flight:
+            self.coalesced += 1
+            in_flight = self.in_flight[key]
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise
+            return await self.get_or_load(key, loader)
+
+        self.misses += 1
+        series = key_series(key)
+        generation = [self.generations.get(item, 0) for item in series]
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self.in_flight[key]
+            if not future.done():
+                future.cancel()
+
+        if [self.generations.get(item, 0) for item in series] == generation:
+            self.entries[key] = (clock.monotonic() + self.ttl, value, series)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return value
+
+    def invalidate(self, symbol: str, interval: str, first_time: int, last_time: int):
+        '''Function that evicts cached results of a series overlapping [first_time, last_time]'''
+        series = (symbol, interval)
+        self.generations[series] = self.generations.get(series, 0) + 1
+        stale = [
+            key for key, (_, _, entry_series) in self.entries.items()
+            if series in entry_series
+            and key_first_time(key) <= last_time and int(key[3]) >= first_time
+        ]
+        for key in stale:
+            del self.entries[key]
+
+    def invalidate_logs(self, logs: list):
+        '''Function that invalidates cached results for every series written in logs'''
+        ranges = {}
+        for log in logs:
+            series = (log['symbol'], log['interval'])
+            time = int(log['time'])
+            first_time, last_time = ranges.get(series, (time, time))
+            ranges[series] = (min(first_time, time), max(last_time, time))
+
+        for (symbol, interval), (first_time, last_time) in ranges.items():
+            self.invalidate(symbol, interval, first_time, last_time)
+
+    def stats(self) -> dict:
+        '''Function that returns cache counters'''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'entries': len(self.entries)
+        }
+
+result_cache = ResultCache()
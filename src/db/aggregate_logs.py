@@ -5,98 +5,104 @@ Module handling all aggregateLogs collection operations
 - Mocked logs retrieval
 '''
 
-import asyncio
-import random
-from datetime import datetime, timezone
+import os
 from pymongo import UpdateOne
+from src.db.bar_buckets import (
+    upsert_bar_buckets, stream_bar_buckets, stream_symbols_bar_buckets
+)
+from src.db.cursor_stream import stream_documents, DEFAULT_BATCH_SIZE
 from src.db.mongo_client import MongoClient
-from src.utils.interval_to_ms import interval_to_ms
+from src.utils.metrics import StageTimer
+from src.utils.structured_log import log_write
+from src.utils.synthetic_data import mocked_aggregate_logs
+
+# 'documents' stores one aggregateLogs document per bar, 'buckets' one aggregateBuckets per day
+AGGREGATE_STORAGE = os.environ.get('AGGREGATE_STORAGE', 'documents')
 
 async def insert_aggregate_logs(logs):
     '''Function that adds logs to aggregateLogs collection in MongoDB'''
     aggregate_logs = MongoClient.get_collection('aggregateLogs')
-    result = await aggregate_logs.insert_many(logs)
-    print(result)
+    with StageTimer('insert', 'aggregateLogs', len(logs)):
+        result = await aggregate_logs.insert_many(logs)
+    log_write('aggregateLogs', result)
 
 async def upsert_aggregate_logs(logs):
     '''Function for mass-inserting/editing aggregation logs'''
+    if AGGREGATE_STORAGE == 'buckets':
+        await upsert_bar_buckets(logs)
+        return
+
     aggregate_logs = MongoClient.get_collection('aggregateLogs')
     operations = []
     for item in logs:
-        query = {'time': item['time']}
+        query = {
+            'symbol': item['symbol'],
+            'interval': item['interval'],
+            'time': item['time']
+        }
         update = {'$set': item}
         operations.append(UpdateOne(query, update, upsert=True))
 
-    result = await aggregate_logs.bulk_write(operations)
-    print(result)
+    with StageTimer('bulk_write', 'aggregateLogs', len(operations)):
+        result = await aggregate_logs.bulk_write(operations, ordered=False)
+    log_write('aggregateLogs', result)
 
-async def get_aggregate_logs(symbol: str, start: str, end: str, interval: str, is_mocked: bool):
-    '''Function that retrieves aggregate data within specified range for symbol'''
+async def stream_aggregate_logs(
+    symbol: str, start: str, end: str, interval: str, is_mocked: bool,
+    batch_size: int = DEFAULT_BATCH_SIZE, fields: tuple = None
+):
+    '''
+    Async generator that streams aggregate data within specified range for symbol
+    Results are read from a single cursor in batches of batch_size, newest first
+    When fields is set, only those fields are read from aggregateLogs documents
+    '''
     if is_mocked is True:
-        await asyncio.sleep(0.5)
-        return get_mocked_aggregate_logs(symbol, start, end, interval)
+        for log in get_mocked_aggregate_logs(symbol, start, end, interval):
+            yield log
+    elif AGGREGATE_STORAGE == 'buckets':
+        async for log in stream_bar_buckets(symbol, start, end, interval, batch_size):
+            yield log
     else:
         aggregate_logs = MongoClient.get_collection('aggregateLogs')
-        skip = 0
-        batch_size = 125
-        logs = []
-
-        while True:
-            pipeline = [
-                {
-                    '$match': { 
-                        'time': {'$gte': start, '$lte': end}, 
-                        'interval': { '$eq': interval } 
-                    }
-                },
-                { '$project': { '_id': 0 } },
-                { '$sort': { 'time': -1 } },
-                { '$skip': skip },
-                { '$limit': batch_size }
-            ]
+        query = {
+            'symbol': {'$eq': symbol},
+            'time': {'$gte': start, '$lte': end},
+            'interval': {'$eq': interval}
+        }
 
-            cursor = aggregate_logs.aggregate(pipeline)
-            log_batch = await cursor.to_list(length=batch_size)
+        async for log in stream_documents(
+            aggregate_logs, query, batch_size, tiebreak=None, fields=fields
+        ):
+            yield log
 
-            if not log_batch:
-                break
-
-            logs.extend(log_batch)
-            skip += batch_size
+async def stream_symbols_aggregate_logs(
+    symbols: list, start: str, end: str, interval: str, is_mocked: bool,
+    batch_size: int = DEFAULT_BATCH_SIZE, fields: tuple = None
+):
+    '''
+    Async generator that streams aggregate data within specified range for several symbols
+    All symbols are read through a single $in cursor, newest first across symbols
+    '''
+    if is_mocked is True:
+        for symbol in symbols:
+            for log in get_mocked_aggregate_logs(symbol, start, end, interval):
+                yield log
+    elif AGGREGATE_STORAGE == 'buckets':
+        async for log in stream_symbols_bar_buckets(symbols, start, end, interval, batch_size):
+            yield log
+    else:
+        aggregate_logs = MongoClient.get_collection('aggregateLogs')
+        query = {
+            'symbol': {'$in': symbols},
+            'time': {'$gte': start, '$lte': end},
+            'interval': {'$eq': interval}
+        }
 
-        return logs
+        async for log in stream_documents(
+            aggregate_logs, query, batch_size, tiebreak='symbol', fields=fields
+        ):
+            yield log
 
 def get_mocked_aggregate_logs(symbol: str, start: str, end: str, interval: str):
     '''Function that returns mock aggregate log values to avoid mongodb operations while testing'''
-    now = int((datetime.now(timezone.utc)).timestamp() * 1000)
-    start_ms = int(round(int(start) / 1000.0 / 60) * 60 * 1000)
-    end_ms = int(round(int(end) / 1000.0 / 60) * 60 * 1000)
-    interval_ms = interval_to_ms(interval)
-    entries_num = (end_ms - start_ms) // interval_ms
-
-    open_price = random.uniform(499.5555, 500.5555)
-    close_price = random.uniform(499.5555, 500.5555)
-    highest = open_price if open_price > close_price else close_price
-    lowest = open_price if open_price < close_price else close_price
-    entries = []
-
-    for i in range(entries_num if entries_num <= 960 else 960):
-        entries.append({
-            'time': str(start_ms + interval_ms * i),
-            'close': round(close_price, 2),
-            'details': '',
-            'fetchTime': str(now),
-            'highest': round(highest + random.uniform(0, 1), 2),
-            'interval': interval,
-            'lowest': round(lowest - random.uniform(0, 1), 2),
-            'number': random.randint(10, 5000),
-            'open': round(open_price, 2),
-            'options': '{}',
-            'rsi14': round(random.uniform(25, 75), 2),
-            'sma5': round(close_price + random.uniform(-2, 2), 2),
-            'symbol': symbol,
-            'volume': random.randint(50000, 200000),
-            'vwap': round(close_price + random.uniform(-4, 4), 4)
-        })
-
-    return entries
+    return mocked_aggregate_logs(symbol, start, end, interval)
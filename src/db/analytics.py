@@ -5,17 +5,19 @@ Module handling all aggregateLogs collection operations
 - Mocked data retrieval
 '''
 
-import asyncio
-import random
 from pymongo import UpdateOne
+from src.db.cursor_stream import stream_documents, DEFAULT_BATCH_SIZE
 from src.db.mongo_client import MongoClient
-from src.utils.interval_to_ms import interval_to_ms
+from src.utils.metrics import StageTimer
+from src.utils.structured_log import log_write
+from src.utils.synthetic_data import mocked_analytics
 
 async def insert_analytics_data(data):
     '''Function that adds datapoints to analytics collection in MongoDB'''
     analytics = MongoClient.get_collection('analytics')
-    result = await analytics.insert_many(data)
-    print(result)
+    with StageTimer('insert', 'analytics', len(data)):
+        result = await analytics.insert_many(data)
+    log_write('analytics', result)
 
 async def upsert_analytics_data(data):
     '''Function for inserting/editing multiple analytics data entries'''
@@ -23,82 +25,72 @@ async def upsert_analytics_data(data):
     operations = []
     for item in data:
         query = {
-            'time': item['time'],
-            'type': item['type']
+            'symbol': item['symbol'],
+            'interval': item['interval'],
+            'type': item['type'],
+            'time': item['time']
         }
         update = {'$set': item}
         operations.append(UpdateOne(query, update, upsert=True))
 
-    result = await analytics.bulk_write(operations)
-    print(result)
+    with StageTimer('bulk_write', 'analytics', len(operations)):
+        result = await analytics.bulk_write(operations, ordered=False)
+    log_write('analytics', result)
 
-async def get_analytics(symbol: str, start: str, end: str, interval: str, is_mocked: bool):
-    '''Function that retrieves analytics data within specified range for symbol'''
+async def get_latest_analytics_time(symbol: str, interval: str):
+    '''Function that returns the time of the newest stored analytics entry of a series, or None'''
+    analytics = MongoClient.get_collection('analytics')
+    latest = await analytics.find_one(
+        {'symbol': symbol, 'interval': interval}, {'_id': 0, 'time': 1}, sort=[('time', -1)]
+    )
+    return None if latest is None else int(latest['time'])
+
+async def stream_analytics(
+    symbol: str, start: str, end: str, interval: str, is_mocked: bool,
+    batch_size: int = DEFAULT_BATCH_SIZE, fields: tuple = None
+):
+    '''
+    Async generator that streams analytics data within specified range for symbol
+    Results are read from a single cursor in batches of batch_size, newest first
+    When fields is set, only those fields are read from analytics documents
+    '''
     if is_mocked is True:
-        await asyncio.sleep(0.5)
-        return get_mocked_analytics(symbol, start, end, interval)
+        for log in get_mocked_analytics(symbol, start, end, interval):
+            yield log
     else:
         analytics = MongoClient.get_collection('analytics')
-        skip = 0
-        batch_size = 125
-        logs = []
-
-        while True:
-            pipeline = [
-                {
-                    '$match': { 
-                        'time': {'$gte': start, '$lte': end}, 
-                        'interval': { '$eq': interval } 
-                    }
-                },
-                { '$project': { '_id': 0 } },
-                { '$sort': { 'time': -1 } },
-                { '$skip': skip },
-                { '$limit': batch_size }
-            ]
-
-            cursor = analytics.aggregate(pipeline)
-            log_batch = await cursor.to_list(length=batch_size)
+        query = {
+            'symbol': {'$eq': symbol},
+            'time': {'$gte': start, '$lte': end},
+            'interval': {'$eq': interval}
+        }
 
-            if not log_batch:
-                break
+        async for log in stream_documents(analytics, query, batch_size, fields=fields):
+            yield log
 
-            logs.extend(log_batch)
-            skip += batch_size
+async def stream_symbols_analytics(
+    symbols: list, start: str, end: str, interval: str, is_mocked: bool,
+    batch_size: int = DEFAULT_BATCH_SIZE, fields: tuple = None
+):
+    '''
+    Async generator that streams analytics data within specified range for several symbols
+    All symbols are read through a single $in cursor, newest first across symbols
+    '''
+    if is_mocked is True:
+        for symbol in symbols:
+            for log in get_mocked_analytics(symbol, start, end, interval):
+                yield log
+    else:
+        analytics = MongoClient.get_collection('analytics')
+        query = {
+            'symbol': {'$in': symbols},
+            'time': {'$gte': start, '$lte': end},
+            'interval': {'$eq': interval}
+        }
 
-        return logs
+        async for log in stream_documents(analytics, query, batch_size, fields=fields):
+            yield log
 
 def get_mocked_analytics(symbol: str, start: str, end: str, interval: str):
-    '''Function that returns mock aggregate log values to avoid mongodb operations while testing'''
-    start_ms = int(round(int(start) / 1000.0 / 60) * 60 * 1000)
-    end_ms = int(round(int(end) / 1000.0 / 60) * 60 * 1000)
-    interval_ms = interval_to_ms(interval)
-    entries_num = (end_ms - start_ms) // interval_ms
-
-    analytic_entries = []
-    analytics_types = [
-        'RSI_OVERSOLD'
-        'RSI_OVERBOUGHT',
-        'VWAP',
-        'BOLL_SQUEEZE'
-        'TOP_BOLL',
-        'MID_BOLL',
-        'BOTTOM_BOLL',
-        'MA',
-        'VOL_SPIKE',
-        'VOL_DEAD',
-        'VI_SQUEEZE'
-    ]
-
-    for i in range(entries_num if entries_num <= 960 else 960):
-        type_index = random.randint(0, len(analytics_types) - 1)
-        analytic_entries.append({
-            'time': str(start_ms + interval_ms * i),
-            'expiration': str(start_ms + interval_ms * (i + 5)),
-            'type': analytics_types[type_index],
-            'interval': interval,
-            'details': 'Test description',
-            'symbol': symbol
-        })
-
-    return analytic_entries
+    '''Function that returns mock analytics values to avoid mongodb operations while testing'''
+    return mocked_analytics(symbol, start, end, interval)
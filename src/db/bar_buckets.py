@@ -0,0 +1,229 @@
+'''
+Module handling the bucketed aggregate logs layout (aggregateBuckets collection)
+- One bucket document per symbol/interval/day holding typed column arrays
+- Bucket merging and versioned upserting, retried on concurrent writes
+- Time slice retrieval unpacking only the requested rows
+'''
+
+from datetime import datetime, timezone
+import numpy as np
+from bson.binary import Binary
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from src.db.cursor_stream import DEFAULT_BATCH_SIZE
+from src.db.mongo_client import MongoClient
+from src.utils.metrics import StageTimer
+from src.utils.structured_log import log_event, log_write
+
+FLOAT_FIELDS = (
+    'open', 'close', 'highest', 'lowest', 'volume', 'vwap',
+    'rsi6', 'rsi14', 'rsi24', 'sma5', 'sma100', 'sma200'
+)
+INT_FIELDS = ('time', 'fetchTime', 'number')
+TEXT_FIELDS = ('options', 'details')
+MISSING_INT = np.iinfo(np.int64).min
+FLOAT_DTYPE = np.dtype('<f8')
+INT_DTYPE = np.dtype('<i8')
+BUCKET_WRITE_ATTEMPTS = 5
+DUPLICATE_KEY_ERROR = 11000
+MAX_BUCKET_TIME = int(datetime(9999, 12, 31, tzinfo=timezone.utc).timestamp() * 1000)
+
+def bucket_day(time: int) -> str:
+    '''
+    Function that returns the UTC day (YYYY-MM-DD) of a unix millisecond timestamp
+    Times past the datetime range (open-ended range ends) map to the last representable day
+    '''
+    time = min(time, MAX_BUCKET_TIME)
+    return datetime.fromtimestamp(time / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+def empty_columns(size: int) -> dict:
+    '''Function that creates bucket columns of given size filled with missing values'''
+    columns = {field: np.full(size, np.nan, dtype=FLOAT_DTYPE) for field in FLOAT_FIELDS}
+    columns.update({field: np.full(size, MISSING_INT, dtype=INT_DTYPE) for field in INT_FIELDS})
+    columns.update({field: np.full(size, '', dtype=object) for field in TEXT_FIELDS})
+    return columns
+
+def unpack_bucket(bucket: dict, first: int = 0, last: int = None) -> dict:
+    '''
+    Function that decodes bucket document columns into arrays, oldest first
+    Numeric columns are read-only views over the document bytes, only rows [first, last) are kept
+    '''
+    columns = {
+        field: np.frombuffer(bucket['columns'][field], dtype=FLOAT_DTYPE)[first:last]
+        for field in FLOAT_FIELDS
+    }
+    columns.update({
+        field: np.frombuffer(bucket['columns'][field], dtype=INT_DTYPE)[first:last]
+        for field in INT_FIELDS
+    })
+    columns.update({
+        field: np.array(bucket[field][first:last], dtype=object) for field in TEXT_FIELDS
+    })
+    return columns
+
+def pack_bucket(symbol: str, interval: str, day: str, columns: dict) -> dict:
+    '''Function that encodes bucket arrays into a bucket document'''
+    return {
+        'symbol': symbol,
+        'interval': interval,
+        'day': day,
+        'minTime': int(columns['time'][0]),
+        'maxTime': int(columns['time'][-1]),
+        'count': len(columns['time']),
+        'columns': {
+            field: Binary(np.ascontiguousarray(columns[field]).tobytes())
+            for field in FLOAT_FIELDS + INT_FIELDS
+        },
+        **{field: columns[field].tolist() for field in TEXT_FIELDS}
+    }
+
+def merge_bucket(columns: dict, logs: list) -> dict:
+    '''
+    Function that merges logs into bucket arrays by time
+    Fields present in a log overwrite stored values, other stored fields are kept
+    '''
+    if columns is None:
+        columns = empty_columns(0)
+
+    times = np.array([int(log['time']) for log in logs], dtype=INT_DTYPE)
+    missing = np.setdiff1d(times, columns['time'])
+    if len(missing):
+        added = empty_columns(len(missing))
+        added['time'] = missing
+        merged = {field: np.concatenate([columns[field], added[field]]) for field in columns}
+        order = np.argsort(merged['time'], kind='stable')
+        columns = {field: values[order] for field, values in merged.items()}
+    else:
+        columns = {field: values.copy() for field, values in columns.items()}
+
+    positions = np.searchsorted(columns['time'], times)
+    for position, log in zip(positions, logs):
+        for field, values in columns.items():
+            value = log.get(field)
+            if value is not None:
+                values[position] = int(value) if field in INT_FIELDS else value
+
+    return columns
+
+def columns_to_logs(columns: dict, symbol: str, interval: str) -> list:
+    '''Function that converts bar arrays into logs with None for missing values, newest first'''
+    rows = {
+        field: [None if np.isnan(value) else value for value in columns[field].tolist()]
+        for field in FLOAT_FIELDS
+    }
+    rows.update({
+        field: [None if value == MISSING_INT else value for value in columns[field].tolist()]
+        for field in INT_FIELDS
+    })
+    rows.update({field: list(columns[field]) for field in TEXT_FIELDS})
+
+    logs = []
+    for index in range(len(columns['time']) - 1, -1, -1):
+        log = {field: values[index] for field, values in rows.items()}
+        log['time'] = str(log['time'])
+        log['fetchTime'] = '' if log['fetchTime'] is None else str(log['fetchTime'])
+        log['symbol'] = symbol
+        log['interval'] = interval
+        logs.append(log)
+
+    return logs
+
+async def read_bar_buckets(aggregate_buckets, keys) -> dict:
+    '''Function that returns the (version, columns) of stored buckets per (symbol, interval, day)'''
+    cursor = aggregate_buckets.find({
+        '$or': [
+            {'symbol': symbol, 'interval': interval, 'day': day}
+            for symbol, interval, day in keys
+        ]
+    })
+    return {
+        (bucket['symbol'], bucket['interval'], bucket['day']):
+            (bucket.get('version'), unpack_bucket(bucket))
+        async for bucket in cursor
+    }
+
+async def upsert_bar_buckets(logs):
+    '''
+    Function for mass-inserting/editing aggregation logs as day buckets
+    A bucket is only replaced if its version did not change since it was read, buckets written
+    concurrently (duplicate key on the version filtered upsert) are read, merged and written again
+    '''
+    aggregate_buckets = MongoClient.get_collection('aggregateBuckets')
+    logs_per_bucket = {}
+    for item in logs:
+        key = (item['symbol'], item['interval'], bucket_day(int(item['time'])))
+        logs_per_bucket.setdefault(key, []).append(item)
+
+    for attempt in range(1, BUCKET_WRITE_ATTEMPTS + 1):
+        if not logs_per_bucket:
+            return
+
+        existing = await read_bar_buckets(aggregate_buckets, logs_per_bucket)
+        keys = list(logs_per_bucket)
+        operations = []
+        for symbol, interval, day in keys:
+            version, columns = existing.get((symbol, interval, day), (None, None))
+            columns = merge_bucket(columns, logs_per_bucket[(symbol, interval, day)])
+            bucket = pack_bucket(symbol, interval, day, columns)
+            bucket['version'] = (version or 0) + 1
+            # A None version also matches buckets stored before versioning
+            query = {'symbol': symbol, 'interval': interval, 'day': day, 'version': version}
+            operations.append(ReplaceOne(query, bucket, upsert=True))
+
+        try:
+            with StageTimer('bulk_write', 'aggregateBuckets', len(operations)):
+                result = await aggregate_buckets.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details['writeErrors']
+            if attempt == BUCKET_WRITE_ATTEMPTS or \
+                    any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            conflicts = [keys[error['index']] for error in errors]
+            logs_per_bucket = {key: logs_per_bucket[key] for key in conflicts}
+            log_event('bucket_write_conflict', buckets=len(conflicts), attempt=attempt)
+            continue
+
+        log_write('aggregateBuckets', result)
+        return
+
+async def stream_bar_buckets(
+    symbol: str, start: str, end: str, interval: str, batch_size: int = DEFAULT_BATCH_SIZE
+):
+    '''
+    Async generator that streams bucketed aggregate data within specified range, newest first
+    Only the rows of each bucket inside [start, end] are converted into logs
+    '''
+    async for log in stream_symbols_bar_buckets([symbol], start, end, interval, batch_size):
+        yield log
+
+async def stream_symbols_bar_buckets(
+    symbols: list, start: str, end: str, interval: str, batch_size: int = DEFAULT_BATCH_SIZE
+):
+    '''
+    Async generator that streams bucketed aggregate data of several symbols through one query
+    Buckets are read newest day first, rows of a bucket newest first
+    '''
+    aggregate_buckets = MongoClient.get_collection('aggregateBuckets')
+    start_time, end_time = int(start), int(end)
+    query = {
+        'symbol': symbols[0] if len(symbols) == 1 else {'$in': symbols},
+        'interval': interval,
+        'day': {'$gte': bucket_day(start_time), '$lte': bucket_day(end_time)}
+    }
+    bucket_batch_size = max(1, batch_size // 1000)
+    cursor = aggregate_buckets.find(query, {'_id': 0}) \
+        .sort('day', -1) \
+        .batch_size(bucket_batch_size)
+
+    try:
+        async for bucket in cursor:
+            times = np.frombuffer(bucket['columns']['time'], dtype=INT_DTYPE)
+            first = int(np.searchsorted(times, start_time, side='left'))
+            last = int(np.searchsorted(times, end_time, side='right'))
+            if first == last:
+                continue
+            columns = unpack_bucket(bucket, first, last)
+            for log in columns_to_logs(columns, bucket['symbol'], interval):
+                yield log
+    finally:
+        await cursor.close()
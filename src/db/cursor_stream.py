@@ -0,0 +1,85 @@
+'''
+Module defining streaming reads over MongoDb collections
+- Single server cursor per stream, fetched in batches of tunable size
+- Keyset pagination on time (and a tiebreak field) to resume a stream whose cursor was lost
+- Time spent waiting on the cursor recorded as the mongo_read stage
+'''
+
+import os
+import time as clock
+from pymongo.errors import CursorNotFound
+from src.utils.metrics import observe_stage
+
+DEFAULT_BATCH_SIZE = int(os.environ.get('MONGO_BATCH_SIZE', 1000))
+MAX_CURSOR_RESUMES = 3
+
+def keyset_filter(last_time: str, last_tiebreak, tiebreak: str, sort_order: int) -> dict:
+    '''Function that builds the filter matching documents after the last streamed key'''
+    operator = '$lt' if sort_order < 0 else '$gt'
+    if tiebreak is None:
+        return {'time': {operator: last_time}}
+
+    return {
+        '$or': [
+            {'time': {operator: last_time}},
+            {'time': last_time, tiebreak: {operator: last_tiebreak}}
+        ]
+    }
+
+async def stream_documents(
+    collection, query: dict, batch_size: int = DEFAULT_BATCH_SIZE, sort_order: int = -1,
+    tiebreak: str = '_id', fields: tuple = None
+):
+    '''
+    Async generator yielding documents matching query ordered by time
+    Documents are read through one cursor, if the server drops it the stream
+    resumes after the last yielded (time, tiebreak) key instead of skipping ahead
+    tiebreak should be None when time is unique among matched documents,
+    so the sort is served entirely by the (..., time) index
+    fields limits the returned document fields (time and tiebreak are always included)
+    '''
+    last_key = None
+    resumes = 0
+    projection = None if tiebreak == '_id' else {'_id': 0}
+    if fields is not None:
+        projection = dict.fromkeys(('time', *fields), 1)
+        if tiebreak is not None:
+            projection[tiebreak] = 1
+        if tiebreak != '_id':
+            projection['_id'] = 0
+    sort = [('time', sort_order)] if tiebreak is None else \
+        [('time', sort_order), (tiebreak, sort_order)]
+
+    while True:
+        if last_key is None:
+            keyset_query = query
+        else:
+            keyset_query = {'$and': [query, keyset_filter(*last_key, tiebreak, sort_order)]}
+
+        cursor = collection.find(keyset_query, projection) \
+            .sort(sort) \
+            .batch_size(batch_size)
+
+        waited = 0.0
+        documents = 0
+        try:
+            while True:
+                started = clock.perf_counter()
+                try:
+                    document = await cursor.next()
+                except StopAsyncIteration:
+                    return
+                waited += clock.perf_counter() - started
+                documents += 1
+                last_tiebreak = None if tiebreak is None else document[tiebreak]
+                if tiebreak == '_id':
+                    del document['_id']
+                last_key = (document['time'], last_tiebreak)
+                yield document
+        except CursorNotFound:
+            resumes += 1
+            if resumes > MAX_CURSOR_RESUMES:
+                raise
+        finally:
+            observe_stage('mongo_read', collection.name, waited, documents)
+            await cursor.close()
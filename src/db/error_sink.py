@@ -0,0 +1,145 @@
+'''
+Module defining the background error sink for the errors collection
+- Non-blocking error reporting through a bounded queue, with drop accounting
+- Batched flushes on size or time triggers
+- Folding of repeated errors into counts, polygon.io responses folded on status and message
+'''
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from src.db.errors import insert_errors
+from src.utils.structured_log import log_event
+
+ERROR_QUEUE_SIZE = int(os.environ.get('ERROR_QUEUE_SIZE', 10000))
+ERROR_BATCH_SIZE = int(os.environ.get('ERROR_BATCH_SIZE', 500))
+ERROR_FLUSH_INTERVAL = float(os.environ.get('ERROR_FLUSH_INTERVAL', 5))
+
+def fold_key(error: dict) -> tuple:
+    '''
+    Function that returns the key identical errors share: description, source and details,
+    JSON object details (polygon.io responses) are reduced to their status and error message
+    so that per-request fields such as request_id do not keep them apart
+    '''
+    details = error.get('details') or ''
+    try:
+        response = json.loads(details)
+    except ValueError:
+        response = None
+    if isinstance(response, dict):
+        details = (response.get('status'), response.get('error') or response.get('message'))
+
+    return error.get('description'), error.get('source'), details
+
+class ErrorSink:
+    '''
+    Class handling error reports off the ingestion hot path
+    - Queue errors without awaiting MongoDb
+    - Flush folded batches through insert_errors
+    '''
+    def __init__(
+        self, queue_size: int = ERROR_QUEUE_SIZE, batch_size: int = ERROR_BATCH_SIZE,
+        flush_interval: float = ERROR_FLUSH_INTERVAL
+    ):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.reported = 0
+        self.task: asyncio.Task = None
+
+    def report(self, error: dict):
+        '''Function that queues an error, dropping it if the queue is full'''
+        try:
+            self.queue.put_nowait(error)
+            self.reported += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self):
+        '''Function that starts the background flush task'''
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        '''Function that stops the flush task and writes any queued errors'''
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        errors = []
+        while not self.queue.empty():
+            errors.append(self.queue.get_nowait())
+        await self.flush(errors)
+
+    async def run(self):
+        '''Function that collects queued errors into batches and flushes them'''
+        loop = asyncio.get_running_loop()
+        while True:
+            errors = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(errors) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    errors.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.flush(errors)
+
+    def fold(self, errors: list) -> list:
+        '''
+        Function that merges identical errors (see fold_key) into one entry with a count
+        and time span, the first error of each key is kept
+        '''
+        folded = {}
+        for error in errors:
+            key = fold_key(error)
+            if key in folded:
+                entry = folded[key]
+                entry['count'] += 1
+                entry['lastTime'] = error.get('time')
+            else:
+                folded[key] = {**error, 'count': 1, 'lastTime': error.get('time')}
+
+        return list(folded.values())
+
+    async def flush(self, errors: list):
+        '''Function that writes a folded batch of errors, including dropped error accounting'''
+        batch = self.fold(errors)
+        if self.dropped:
+            error_time = str(int((datetime.now(timezone.utc)).timestamp() * 1000))
+            batch.append({
+                'time': error_time,
+                'description': 'Errors dropped by full error queue',
+                'source': 'src/db/error_sink.py - flush',
+                'details': '',
+                'count': self.dropped,
+                'lastTime': error_time
+            })
+            self.dropped = 0
+
+        if not batch:
+            return
+
+        try:
+            await insert_errors(batch)
+        except Exception as e:
+            log_event('error_sink_error', level=logging.ERROR, errors=len(batch), error=str(e))
+
+    def stats(self) -> dict:
+        '''Function that returns reported, queued and pending dropped error counts'''
+        return {
+            'reported': self.reported,
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped
+        }
+
+error_sink = ErrorSink()
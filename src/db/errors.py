@@ -4,15 +4,12 @@ Module handling all errors collection operations
 '''
 
 from src.db.mongo_client import MongoClient
+from src.utils.metrics import StageTimer
+from src.utils.structured_log import log_write
 
 async def insert_errors(errors):
     '''Function that adds errors to errors collection in MongoDB'''
     errors_collection = MongoClient.get_collection('errors')
-    result = await errors_collection.insert_many(errors)
-    print(result)
-
-async def insert_error(error):
-    '''Function that adds error to errors collection in MongoDB'''
-    errors_collection = MongoClient.get_collection('errors')
-    result = await errors_collection.insert_one(error)
-    print(result)
+    with StageTimer('insert', 'errors', len(errors)):
+        result = await errors_collection.insert_many(errors)
+    log_write('errors', result)
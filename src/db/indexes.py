@@ -0,0 +1,124 @@
+'''
+Module handling index bootstrap for MongoDb collections
+- Declared compound indexes per collection
+- Missing index creation
+- Unused and conflicting index warnings
+'''
+
+from pymongo.errors import OperationFailure
+from src.db.mongo_client import MongoClient
+
+INDEXES = {
+    'aggregateLogs': [
+        {
+            'name': 'symbol_interval_time',
+            'keys': [('symbol', 1), ('interval', 1), ('time', 1)],
+            'unique': True
+        }
+    ],
+    'aggregateBuckets': [
+        {
+            'name': 'symbol_interval_day',
+            'keys': [('symbol', 1), ('interval', 1), ('day', 1)],
+            'unique': True
+        }
+    ],
+    'aggregateRollups': [
+        {
+            'name': 'symbol_interval_time',
+            'keys': [('symbol', 1), ('interval', 1), ('time', 1)],
+            'unique': True
+        }
+    ],
+    'backfillJobs': [
+        {
+            'name': 'jobId',
+            'keys': [('jobId', 1)],
+            'unique': True
+        }
+    ],
+    'backfillChunks': [
+        {
+            'name': 'jobId_status',
+            'keys': [('jobId', 1), ('status', 1)],
+            'unique': False
+        }
+    ],
+    'analytics': [
+        {
+            'name': 'symbol_interval_type_time',
+            'keys': [('symbol', 1), ('interval', 1), ('type', 1), ('time', 1)],
+            'unique': True
+        },
+        {
+            'name': 'symbol_interval_time',
+            'keys': [('symbol', 1), ('interval', 1), ('time', 1)],
+            'unique': False
+        }
+    ]
+}
+
+async def get_index_usage(collection) -> dict:
+    '''Function that returns operation counts per index name, empty if $indexStats is unavailable'''
+    try:
+        stats = await collection.aggregate([{'$indexStats': {}}]).to_list(length=None)
+    except OperationFailure:
+        return {}
+
+    return {stat['name']: stat['accesses']['ops'] for stat in stats}
+
+async def ensure_indexes(indexes: dict = None):
+    '''
+    Function that creates declared indexes missing from their collections
+    Existing indexes with the same keys but other options, or undeclared indexes, are reported
+    '''
+    indexes = INDEXES if indexes is None else indexes
+
+    for collection_name, declared_indexes in indexes.items():
+        collection = MongoClient.get_collection(collection_name)
+        existing = await collection.index_information()
+        declared_keys = []
+
+        for index in declared_indexes:
+            keys = [tuple(key) for key in index['keys']]
+            declared_keys.append(keys)
+            current = next(
+                (
+                    (name, info) for name, info in existing.items()
+                    if [tuple(key) for key in info['key']] == keys
+                ),
+                None
+            )
+
+            if current is None:
+                if index['name'] in existing:
+                    print(
+                        f'Index conflict on {collection_name}: {index["name"]} '
+                        f'exists with keys {existing[index["name"]]["key"]}'
+                    )
+                    continue
+                try:
+                    await collection.create_index(
+                        keys, name=index['name'], unique=index.get('unique', False)
+                    )
+                    print(f'Index created on {collection_name}: {index["name"]}')
+                except OperationFailure as e:
+                    print(f'Index creation failed on {collection_name}: {index["name"]} - {e}')
+                continue
+
+            name, info = current
+            if info.get('unique', False) != index.get('unique', False):
+                print(
+                    f'Index conflict on {collection_name}: {name} has unique={info.get("unique", False)}, '
+                    f'expected unique={index.get("unique", False)}'
+                )
+
+        usage = await get_index_usage(collection)
+        for name, info in existing.items():
+            keys = [tuple(key) for key in info['key']]
+            if name == '_id_' or keys in declared_keys:
+                continue
+            if usage.get(name) == 0:
+                print(f'Unused index on {collection_name}: {name} {keys}')
+            else:
+                print(f'Undeclared index on {collection_name}: {name} {keys}')
@@ -0,0 +1,68 @@
+'''
+Module handling all aggregateRollups collection operations
+- Rollup bars insertion/editing
+- Rollup bars retrieval
+'''
+
+from pymongo import UpdateOne
+from src.db.cursor_stream import stream_documents, DEFAULT_BATCH_SIZE
+from src.db.mongo_client import MongoClient
+from src.utils.metrics import StageTimer
+from src.utils.structured_log import log_write
+
+async def upsert_rollups(rollups):
+    '''Function for mass-inserting/editing multi-timeframe rollup bars'''
+    aggregate_rollups = MongoClient.get_collection('aggregateRollups')
+    operations = []
+    for item in rollups:
+        query = {
+            'symbol': item['symbol'],
+            'interval': item['interval'],
+            'time': item['time']
+        }
+        update = {'$set': item}
+        operations.append(UpdateOne(query, update, upsert=True))
+
+    with StageTimer('bulk_write', 'aggregateRollups', len(operations)):
+        result = await aggregate_rollups.bulk_write(operations, ordered=False)
+    log_write('aggregateRollups', result)
+
+async def stream_rollups(
+    symbol: str, start: str, end: str, interval: str, batch_size: int = DEFAULT_BATCH_SIZE,
+    fields: tuple = None
+):
+    '''
+    Async generator that streams rollup bars within specified range for symbol, newest first
+    When fields is set, only those fields are read from aggregateRollups documents
+    '''
+    aggregate_rollups = MongoClient.get_collection('aggregateRollups')
+    query = {
+        'symbol': {'$eq': symbol},
+        'time': {'$gte': start, '$lte': end},
+        'interval': {'$eq': interval}
+    }
+
+    async for rollup in stream_documents(
+        aggregate_rollups, query, batch_size, tiebreak=None, fields=fields
+    ):
+        yield rollup
+
+async def stream_symbols_rollups(
+    symbols: list, start: str, end: str, interval: str, batch_size: int = DEFAULT_BATCH_SIZE,
+    fields: tuple = None
+):
+    '''
+    Async generator that streams rollup bars within specified range for several symbols
+    All symbols are read through a single $in cursor, newest first across symbols
+    '''
+    aggregate_rollups = MongoClient.get_collection('aggregateRollups')
+    query = {
+        'symbol': {'$in': symbols},
+        'time': {'$gte': start, '$lte': end},
+        'interval': {'$eq': interval}
+    }
+
+    async for rollup in stream_documents(
+        aggregate_rollups, query, batch_size, tiebreak='symbol', fields=fields
+    ):
+        yield rollup
@@ -0,0 +1,26 @@
+'''
+Module that defines schema extensions for GQL schema
+'''
+
+import time as clock
+from graphql import OperationDefinitionNode
+from strawberry.extensions import SchemaExtension
+from src.utils.metrics import observe_stage
+
+class MetricsExtension(SchemaExtension):
+    '''
+    Schema extension timing every executed operation as the graphql stage,
+    labeled by the root fields it selects (e.g. getStockData)
+    '''
+    def on_execute(self):
+        started = clock.perf_counter()
+        yield
+        document = self.execution_context.graphql_document
+        fields = set()
+        for definition in document.definitions if document else []:
+            if isinstance(definition, OperationDefinitionNode):
+                fields.update(
+                    selection.name.value for selection in definition.selection_set.selections
+                    if hasattr(selection, 'name')
+                )
+        observe_stage('graphql', '+'.join(sorted(fields)), clock.perf_counter() - started, 1)
@@ -1,5 +1,7 @@
 import strawberry
+from src.gql.extensions import MetricsExtension
 from src.gql.stock_query import StockQuery
+from src.gql.stock_subscription import StockSubscription
 
 @strawberry.type
 class Query(StockQuery):
@@ -9,8 +11,10 @@ class Query(StockQuery):
 # class Mutation():
 #     pass
 
-# @strawberry.type
-# class Subscription(Subscription):
-#     pass
+@strawberry.type
+class Subscription(StockSubscription):
+    '''Extended subscription inheriting/extending other subscriptions'''
 
-schema = strawberry.Schema(query=Query)
+schema = strawberry.Schema(
+    query=Query, subscription=Subscription, extensions=[MetricsExtension]
+)
@@ -0,0 +1,45 @@
+'''
+Module that reads GraphQL selection sets, so resolvers only load the fields a client asked for
+'''
+
+from typing import Optional
+import strawberry
+from strawberry.types.nodes import SelectedField
+
+def collect_field_names(selections: list, names: set):
+    '''Function that adds the field names of selections, expanding fragments, to names'''
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            names.add(selection.name)
+        else:
+            collect_field_names(selection.selections, names)
+
+def find_selections(selections: list, name: str) -> list:
+    '''Function that gathers the sub-selections of every field called name, expanding fragments'''
+    found = []
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            if selection.name == name:
+                found.extend(selection.selections)
+        else:
+            found.extend(find_selections(selection.selections, name))
+
+    return found
+
+def get_selected_fields(info: strawberry.Info, *path: str) -> Optional[tuple]:
+    '''
+    Function that returns the sorted field names selected on the resolved field,
+    or on the nested field at path (e.g. 'data'), None when nothing could be read
+    '''
+    if not info.selected_fields:
+        return None
+
+    selections = info.selected_fields[0].selections
+    for name in path:
+        selections = find_selections(selections, name)
+
+    names = set()
+    collect_field_names(selections, names)
+    names.discard('__typename')
+
+    return tuple(sorted(names)) if names else None
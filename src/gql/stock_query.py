@@ -2,13 +2,34 @@
 Module that defines query fields for stock information for GQL schema
 '''
 
+import asyncio
 import os
+from enum import Enum
 from typing import List, Optional
 import strawberry
-from src.db.aggregate_logs import get_aggregate_logs
-from src.db.analytics import get_analytics
+from src.cache.result_cache import result_cache
+from src.db.analytics import stream_analytics, stream_symbols_analytics
+from src.processes.rollups import (
+    stream_interval_logs, get_interval_columns, get_symbols_interval_logs
+)
+from src.gql.selection import get_selected_fields
+from src.utils.downsample import downsample_logs, downsample_columns, OHLC_FIELDS
 
-IS_MOCKED = os.environ.get('IS_MOCKED', 'false')
+IS_MOCKED = os.environ.get('IS_MOCKED', 'false').strip().lower() in ('true', '1', 'yes')
+
+# Fields always read from MongoDb, whatever the client selected
+DATUM_KEY_FIELDS = ('symbol', 'interval', 'time')
+ANALYTICS_KEY_FIELDS = ('symbol', 'interval', 'time', 'type')
+
+@strawberry.enum
+class Downsample(Enum):
+    '''
+    Downsampling methods applied when a query limits its number of points:
+        OHLC - bars are aggregated into min/max candles, preserving wicks
+        LTTB - representative bars are picked on close (Largest-Triangle-Three-Buckets)
+    '''
+    OHLC = 'ohlc'
+    LTTB = 'lttb'
 
 @strawberry.type
 class Datum:
@@ -42,17 +63,17 @@ class Datum:
     lowest: Optional[float] = None
     volume: Optional[float] = None
     vwap: Optional[float] = None
-    # rsi6: Optional[float] = None
+    rsi6: Optional[float] = None
     rsi14: Optional[float] = None
-    # rsi24: Optional[float] = None
+    rsi24: Optional[float] = None
     sma5: Optional[float] = None
-    # sma100: Optional[float] = None
-    # sma200: Optional[float] = None
+    sma100: Optional[float] = None
+    sma200: Optional[float] = None
     time: str
-    fetchTime: str
+    fetchTime: str = ''
     number: Optional[int] = None
-    options: str
-    details: str
+    options: str = ''
+    details: str = ''
 
 @strawberry.type
 class Analytics:
@@ -66,11 +87,152 @@ class Analytics:
         symbol - ticker symbol
     '''
     time: str
-    expiration: str
+    expiration: str = ''
     type: str
     interval: str
-    details: str
+    details: str = ''
+    symbol: str
+
+@strawberry.type
+class StockSeries:
+    '''
+    Columnar market data return object, every list holds one value per bar, oldest first:
+        symbol - ticker symbol
+        interval - interval/timeframe for when market data was retrieved
+        time - unix millisecond timestamps
+        open - open prices
+        close - close prices
+        highest - highest prices
+        lowest - lowest prices
+        volume - trading volumes
+        vwap - volume weighed average prices
+        rsi6, rsi14, rsi24 - relative strength indexes (window size = 6, 14, 24)
+        sma5, sma100, sma200 - simple moving averages (window size = 5, 100, 200)
+    '''
     symbol: str
+    interval: str
+    time: List[str]
+    open: List[Optional[float]]
+    close: List[Optional[float]]
+    highest: List[Optional[float]]
+    lowest: List[Optional[float]]
+    volume: List[Optional[float]]
+    vwap: List[Optional[float]]
+    rsi6: List[Optional[float]]
+    rsi14: List[Optional[float]]
+    rsi24: List[Optional[float]]
+    sma5: List[Optional[float]]
+    sma100: List[Optional[float]]
+    sma200: List[Optional[float]]
+
+@strawberry.type
+class StockDashboard:
+    '''
+    Dashboard return object for one symbol:
+        symbol - ticker symbol
+        interval - interval/timeframe for when market data was retrieved
+        data - market data (bars and indicators), newest first
+        analytics - analytics/patterns discovered within the range, newest first
+    '''
+    symbol: str
+    interval: str
+    data: List[Datum]
+    analytics: List[Analytics]
+
+def get_read_fields(selected: tuple, key_fields: tuple, max_points: Optional[int] = None):
+    '''
+    Function that turns selected GraphQL fields into the fields read from MongoDb,
+    None (whole documents) when the selection is unknown
+    Downsampled reads also need every OHLC field to aggregate candles
+    '''
+    if selected is None:
+        return None
+
+    fields = set(selected) | set(key_fields)
+    if max_points is not None:
+        fields |= set(OHLC_FIELDS)
+
+    return tuple(sorted(fields))
+
+async def load_stock_data(
+    symbol: str, start: str, end: str, interval: str,
+    max_points: Optional[int] = None, downsample: Downsample = Downsample.OHLC,
+    fields: tuple = None
+) -> List[Datum]:
+    '''Function that builds stock data objects for a range, downsampled to max_points'''
+    logs = [
+        item async for item in stream_interval_logs(
+            symbol, start, end, interval, IS_MOCKED, fields
+        )
+    ]
+    return [Datum(**item) for item in downsample_logs(logs, max_points, downsample.value)]
+
+async def load_stock_series(
+    symbol: str, start: str, end: str, interval: str,
+    max_points: Optional[int] = None, downsample: Downsample = Downsample.OHLC,
+    fields: tuple = None
+) -> StockSeries:
+    '''Function that builds a columnar stock series for a range, downsampled to max_points'''
+    columns = await get_interval_columns(symbol, start, end, interval, IS_MOCKED, fields)
+    columns = downsample_columns(columns, max_points, downsample.value)
+    return StockSeries(symbol=symbol, interval=interval, **columns)
+
+async def load_stock_analytics(
+    symbol: str, start: str, end: str, interval: str, fields: tuple = None
+) -> List[Analytics]:
+    '''Function that builds stock analytics objects for a range'''
+    return [
+        Analytics(**item)
+        async for item in stream_analytics(
+            symbol, start, end, interval, IS_MOCKED, fields=fields
+        )
+    ]
+
+async def load_dashboard_data(
+    symbols: list, start: str, end: str, interval: str, fields: tuple = None
+) -> dict:
+    '''
+    Function that retrieves bars for several symbols, newest first per symbol
+    Every interval kind is read through one batched query (see get_symbols_interval_logs)
+    '''
+    return await get_symbols_interval_logs(symbols, start, end, interval, IS_MOCKED, fields)
+
+async def load_dashboard_analytics(
+    symbols: list, start: str, end: str, interval: str, fields: tuple = None
+) -> dict:
+    '''Function that retrieves analytics for several symbols through one batched query'''
+    analytics_per_symbol = {symbol: [] for symbol in symbols}
+    async for item in stream_symbols_analytics(
+        symbols, start, end, interval, IS_MOCKED, fields=fields
+    ):
+        analytics_per_symbol[item['symbol']].append(item)
+
+    return analytics_per_symbol
+
+async def load_stock_dashboard(
+    symbols: tuple, start: str, end: str, interval: str,
+    max_points: Optional[int] = None, downsample: Downsample = Downsample.OHLC,
+    data_fields: tuple = None, analytics_fields: tuple = None
+) -> List[StockDashboard]:
+    '''Function that builds dashboards for several symbols, bars and analytics load concurrently'''
+    symbols = list(symbols)
+    data, analytics = await asyncio.gather(
+        load_dashboard_data(symbols, start, end, interval, data_fields),
+        load_dashboard_analytics(symbols, start, end, interval, analytics_fields)
+    )
+
+    return [
+        StockDashboard(
+            symbol=symbol,
+            interval=interval,
+            data=[
+                Datum(**item)
+                for item in downsample_logs(data[symbol], max_points, downsample.value)
+            ],
+            analytics=[Analytics(**item) for item in analytics[symbol]]
+        )
+        for symbol in symbols
+    ]
 
 @strawberry.type
 class StockQuery:
@@ -79,42 +241,79 @@ class StockQuery:
     '''
     @strawberry.field
     async def get_stock_data(
-        self, symbol: str, start: str, end: str, interval: str
+        self, info: strawberry.Info, symbol: str, start: str, end: str, interval: str,
+        max_points: Optional[int] = None, downsample: Downsample = Downsample.OHLC
     ) -> List[Datum]:
         '''
         Query field for stock data
-        Resolver retrieves market data from MongoDb query
+        Resolver retrieves market data from the bar cache, or MongoDb query for older data
+        Coarser intervals (e.g. 15minute) are served from pre-materialized rollups
+        maxPoints bounds the number of returned bars for zoomed-out charts
+        Only the selected fields are read from MongoDb
+        Identical concurrent requests share one load, results are cached until invalidated
         '''
-        data = await get_aggregate_logs(symbol, start, end, interval, bool(IS_MOCKED))
-
-        stock_data = [Datum(**item) for item in data]
+        fields = get_read_fields(get_selected_fields(info), DATUM_KEY_FIELDS, max_points)
+        return await result_cache.get_or_load(
+            ('getStockData', symbol, start, end, interval, max_points, downsample.value, fields),
+            lambda: load_stock_data(symbol, start, end, interval, max_points, downsample, fields)
+        )
 
-        return stock_data
+    @strawberry.field
+    async def get_stock_series(
+        self, info: strawberry.Info, symbol: str, start: str, end: str, interval: str,
+        max_points: Optional[int] = None, downsample: Downsample = Downsample.OHLC
+    ) -> StockSeries:
+        '''
+        Query field for columnar stock data, meant for charting clients
+        Resolver slices bar cache arrays directly, or MongoDb query for older data
+        maxPoints bounds the number of returned bars for zoomed-out charts
+        Only the selected columns are read from MongoDb
+        '''
+        fields = get_read_fields(get_selected_fields(info), DATUM_KEY_FIELDS, max_points)
+        return await result_cache.get_or_load(
+            ('getStockSeries', symbol, start, end, interval, max_points, downsample.value, fields),
+            lambda: load_stock_series(symbol, start, end, interval, max_points, downsample, fields)
+        )
 
     @strawberry.field
     async def get_stock_analytics(
-        self, symbol: str, start: str, end: str, interval: str
+        self, info: strawberry.Info, symbol: str, start: str, end: str, interval: str
     ) -> List[Analytics]:
         '''
         Query field for stock analytics
-        Resolver retrieves analytics from MongoDb query
+        Resolver retrieves analytics from MongoDb query, reading only the selected fields
+        Identical concurrent requests share one load, results are cached until invalidated
         '''
-        data = await get_analytics(symbol, start, end, interval, bool(IS_MOCKED))
-
-        analytics = [Analytics(**item) for item in data]
-
-        return analytics
+        fields = get_read_fields(get_selected_fields(info), ANALYTICS_KEY_FIELDS)
+        return await result_cache.get_or_load(
+            ('getStockAnalytics', symbol, start, end, interval, fields),
+            lambda: load_stock_analytics(symbol, start, end, interval, fields)
+        )
 
     @strawberry.field
     async def get_stock_dashboard(
-        self, symbol: str, start: str, end: str, interval: str
-    ) -> List[Analytics]:
+        self, info: strawberry.Info, symbols: List[str], start: str, end: str, interval: str,
+        max_points: Optional[int] = None, downsample: Downsample = Downsample.OHLC
+    ) -> List[StockDashboard]:
         '''
-        Query field for stock analytics
-        Resolver retrieves analytics from MongoDb query
+        Query field for bars, indicators and analytics of several symbols
+        Resolver batches all symbols into one query per collection, both run concurrently
+        Only the selected bar and analytics fields are read from MongoDb
         '''
-        data = await get_analytics(symbol, start, end, interval, bool(IS_MOCKED))
-
-        analytics = [Analytics(**item) for item in data]
-
-        return analytics
+        symbols = tuple(dict.fromkeys(symbols))
+        data_fields = get_read_fields(
+            get_selected_fields(info, 'data'), DATUM_KEY_FIELDS, max_points
+        )
+        analytics_fields = get_read_fields(
+            get_selected_fields(info, 'analytics'), ANALYTICS_KEY_FIELDS
+        )
+        return await result_cache.get_or_load(
+            (
+                'getStockDashboard', symbols, start, end, interval, max_points,
+                downsample.value, data_fields, analytics_fields
+            ),
+            lambda: load_stock_dashboard(
+                symbols, start, end, interval, max_points, downsample,
+                data_fields, analytics_fields
+            )
+        )
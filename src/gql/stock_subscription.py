@@ -0,0 +1,38 @@
+'''
+Module that defines subscription fields for live stock information for GQL schema
+'''
+
+from contextlib import aclosing
+from typing import AsyncGenerator, List
+import strawberry
+from src.gql.stock_query import Datum, Analytics
+from src.processes.broadcaster import broadcaster
+
+@strawberry.type
+class StockSubscription:
+    '''
+    Class defining all subscription operations for stock data
+    '''
+    @strawberry.subscription
+    async def stock_data(
+        self, symbol: str, interval: str
+    ) -> AsyncGenerator[List[Datum], None]:
+        '''
+        Subscription field for new and updated bars, oldest first per batch
+        Batches are pushed by the ingestion rounds right after they are written
+        '''
+        async with aclosing(broadcaster.subscribe('bars', symbol, interval)) as batches:
+            async for batch in batches:
+                yield [Datum(**item) for item in batch]
+
+    @strawberry.subscription
+    async def stock_analytics(
+        self, symbol: str, interval: str
+    ) -> AsyncGenerator[List[Analytics], None]:
+        '''
+        Subscription field for newly detected analytics signals
+        Batches are pushed by the analytics rounds right after they are written
+        '''
+        async with aclosing(broadcaster.subscribe('analytics', symbol, interval)) as batches:
+            async for batch in batches:
+                yield [Analytics(**item) for item in batch]
@@ -5,7 +5,8 @@ Module that handles polygon.io API requests for market data
 import os
 import textwrap
 from dataclasses import dataclass
-import aiohttp
+from src.http.polygon_client import PolygonClient, POLYGON_BASE_URL
+from src.http.rate_limiter import Priority
 
 POLYGON_IO_API_KEY = os.environ.get("POLYGON_IO_API_KEY")
 
@@ -16,8 +17,8 @@ class BarAggregatesParams:
         symbol - ticker symbol
         window - interval window size
         interval - aggregate time interval (second, minute, hour, day, etc.)
-        start_date - start of aggregate time window (YYYY-MM-DD)
-        end_date - end of aggregate time window (YYYY-MM-DD)
+        start_date - start of aggregate time window (YYYY-MM-DD or unix millisecond timestamp)
+        end_date - end of aggregate time window (YYYY-MM-DD or unix millisecond timestamp)
         order - result order (asc, desc)
         limit - number of retrieved aggregate bars
     '''
@@ -29,17 +30,26 @@ class BarAggregatesParams:
     order: str
     limit: int
 
-async def get_bar_aggregates(params: BarAggregatesParams):
+async def get_bar_aggregates(params: BarAggregatesParams, priority: Priority = Priority.LIVE):
     '''
     Poligon.io request to retrieve market data as bar aggregates (candlebars)
     '''
     url = textwrap.dedent(f'''
-        https://api.polygon.io/v2/aggs/ticker/{params.symbol}/range/{params.window}/{params.interval}/{params.start_date}/
+        {POLYGON_BASE_URL}/v2/aggs/ticker/{params.symbol}/range/{params.window}/{params.interval}/{params.start_date}/
         {params.end_date}?sort={params.order}&limit={params.limit}&apiKey={POLYGON_IO_API_KEY}
     ''').replace('\n', '')
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, timeout=5) as response:
-            data = await response.json()
+    data = await PolygonClient.get_json(url, priority, 'aggregates')
+
+    return data
+
+async def get_next_aggregates_page(next_url: str, priority: Priority = Priority.LIVE):
+    '''
+    Poligon.io request to retrieve the next page of a paginated bar aggregates response
+    '''
+    separator = '&' if '?' in next_url else '?'
+    data = await PolygonClient.get_json(
+        f'{next_url}{separator}apiKey={POLYGON_IO_API_KEY}', priority, 'aggregates'
+    )
 
     return data
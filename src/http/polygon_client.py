@@ -0,0 +1,108 @@
+'''
+Module defining class for handling the process-wide polygon.io HTTP session
+Uses singleton pattern, every polygon request shares one pooled keep-alive session
+'''
+
+import asyncio
+import os
+import random
+import aiohttp
+from src.http.rate_limiter import Priority, TokenBucket
+from src.http.recorder import write_recording, POLYGON_RECORD_DIR
+from src.utils.metrics import StageTimer, POLYGON_RESPONSES
+
+POLYGON_BASE_URL = os.environ.get('POLYGON_BASE_URL', 'https://api.polygon.io').rstrip('/')
+POLYGON_MAX_CONNECTIONS = int(os.environ.get('POLYGON_MAX_CONNECTIONS', 10))
+POLYGON_DNS_CACHE_TTL = int(os.environ.get('POLYGON_DNS_CACHE_TTL', 300))
+POLYGON_RATE_LIMIT = float(os.environ.get('POLYGON_RATE_LIMIT', 50))
+POLYGON_RATE_BURST = int(os.environ.get('POLYGON_RATE_BURST', 50))
+REQUEST_TIMEOUT = 5
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class PolygonClient:
+    '''
+    Class handling the shared polygon.io session
+    - Open pooled session with DNS caching
+    - Send rate limited requests with jittered retries
+    - Record successful responses when POLYGON_RECORD_DIR is set
+    - Close session
+    '''
+    _instance = None
+    session: aiohttp.ClientSession = None
+    limiter: TokenBucket = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PolygonClient, cls).__new__(cls)
+        return cls._instance
+
+    @classmethod
+    async def open_session(cls):
+        '''
+        Function that opens the shared session with a bounded connection pool
+        '''
+        if not cls.session:
+            connector = aiohttp.TCPConnector(
+                limit=POLYGON_MAX_CONNECTIONS,
+                ttl_dns_cache=POLYGON_DNS_CACHE_TTL
+            )
+            cls.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+            cls.limiter = TokenBucket(POLYGON_RATE_LIMIT, POLYGON_RATE_BURST)
+
+    @classmethod
+    async def get_json(
+        cls, url: str, priority: Priority = Priority.LIVE, endpoint: str = 'polygon'
+    ):
+        '''
+        Function that sends a GET request through the shared session
+        429 and 5xx responses and connection errors are retried with jittered backoff,
+        the last response body is returned as-is once retries are exhausted
+        Request time, retries included, is recorded as the fetch stage of endpoint
+        '''
+        if not cls.session:
+            await cls.open_session()
+
+        with StageTimer('fetch', endpoint, 1):
+            return await cls.request_json(url, priority, endpoint)
+
+    @classmethod
+    async def request_json(cls, url: str, priority: Priority, endpoint: str):
+        '''Function that sends a GET request with retries, counting responses per status'''
+        for attempt in range(MAX_RETRIES + 1):
+            await cls.limiter.acquire(priority)
+            delay = random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+            try:
+                async with cls.session.get(url) as response:
+                    POLYGON_RESPONSES.labels(endpoint, str(response.status)).inc()
+                    if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                        data = await response.json(content_type=None)
+                        if POLYGON_RECORD_DIR and response.status == 200:
+                            await asyncio.to_thread(
+                                write_recording, POLYGON_RECORD_DIR, url, endpoint,
+                                response.status, data
+                            )
+                        return data
+                    retry_after = response.headers.get('Retry-After')
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                POLYGON_RESPONSES.labels(endpoint, 'error').inc()
+                if attempt == MAX_RETRIES:
+                    raise
+            await asyncio.sleep(delay)
+
+    @classmethod
+    async def close_session(cls):
+        '''
+        Function to close the shared session and reset class instance
+        '''
+        if cls.session:
+            await cls.session.close()
+        cls._instance = None
+        cls.session = None
+        cls.limiter = None
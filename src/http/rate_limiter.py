@@ -0,0 +1,66 @@
+'''
+Module defining a token-bucket rate limiter shared by every polygon.io request
+- Tokens refill continuously up to the bucket capacity
+- Waiting requests are served by priority, then in arrival order
+'''
+
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+
+class Priority(IntEnum):
+    '''
+    Request priorities, lower values are served first:
+        LIVE - live ingestion requests where latency matters
+        BULK - backfills and other bulk work
+    '''
+    LIVE = 0
+    BULK = 1
+
+class TokenBucket:
+    '''
+    Class handling request admission at a sustained rate with bursts up to capacity
+    - Acquire a token, waiting behind higher priority requests when the bucket is empty
+    '''
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.waiters = []
+        self.counter = itertools.count()
+        self.dispatcher: asyncio.Task = None
+
+    def refill(self):
+        '''Function that adds the tokens accrued since the last refill'''
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, priority: Priority = Priority.LIVE):
+        '''Function that waits until a token is available for a request of given priority'''
+        self.refill()
+        if not self.waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), waiter))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self.dispatch())
+        await waiter
+
+    async def dispatch(self):
+        '''Function that hands out tokens to waiting requests as they refill'''
+        while self.waiters:
+            self.refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            _, _, waiter = heapq.heappop(self.waiters)
+            if not waiter.done():
+                self.tokens -= 1
+                waiter.set_result(None)
@@ -0,0 +1,48 @@
+'''
+Module defining the polygon.io response recorder
+- Gzip compressed JSON recordings, one file per request with the API key stripped
+- Recording loading for the replay server
+Recording is enabled by setting POLYGON_RECORD_DIR
+'''
+
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import List
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+POLYGON_RECORD_DIR = os.environ.get('POLYGON_RECORD_DIR')
+RECORDING_SUFFIX = '.json.gz'
+
+def strip_api_key(url: str) -> str:
+    '''Function that returns the request path and query without the apiKey parameter'''
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != 'apiKey']
+    return f'{parts.path}?{urlencode(query)}' if query else parts.path
+
+def write_recording(directory: str, url: str, endpoint: str, status: int, body):
+    '''Function that stores one response as a gzip file named after its request'''
+    request = strip_api_key(url)
+    name = f'{endpoint}-{hashlib.sha1(request.encode()).hexdigest()[:16]}{RECORDING_SUFFIX}'
+    recording = {
+        'request': request,
+        'endpoint': endpoint,
+        'status': status,
+        'recordedAt': int(datetime.now(timezone.utc).timestamp() * 1000),
+        'body': body
+    }
+    os.makedirs(directory, exist_ok=True)
+    with gzip.open(os.path.join(directory, name), 'wt', encoding='utf-8') as file:
+        json.dump(recording, file)
+
+def load_recordings(directory: str) -> List[dict]:
+    '''Function that reads every recording of a directory, oldest first'''
+    recordings = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(RECORDING_SUFFIX):
+            with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as file:
+                recordings.append(json.load(file))
+
+    return sorted(recordings, key=lambda recording: recording['recordedAt'])
@@ -5,7 +5,8 @@ Module that handles the polygon.io API requests for simple moving average (SMA)
 import os
 import textwrap
 from dataclasses import dataclass
-import aiohttp
+from src.http.polygon_client import PolygonClient, POLYGON_BASE_URL
+from src.http.rate_limiter import Priority
 
 POLYGON_IO_API_KEY = os.environ.get("POLYGON_IO_API_KEY")
 
@@ -27,15 +28,13 @@ class SmaIndicatorParams:
     order: str
     limit: int
 
-async def get_sma_data(params: SmaIndicatorParams):
+async def get_sma_data(params: SmaIndicatorParams, priority: Priority = Priority.LIVE):
     '''Function to request simple moving average (SMA) data from polygon api'''
     url = textwrap.dedent(f'''
-        https://api.polygon.io/v1/indicators/sma/{params.symbol}?timestamp={params.date}&timespan={params.interval}&window={params.window}
+        {POLYGON_BASE_URL}/v1/indicators/sma/{params.symbol}?timestamp={params.date}&timespan={params.interval}&window={params.window}
         &series_type=close&order={params.order}&limit={params.limit}&apiKey={POLYGON_IO_API_KEY}
     ''').replace('\n', '')
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, timeout=5) as response:
-            data = await response.json()
+    data = await PolygonClient.get_json(url, priority, 'sma')
 
     return data
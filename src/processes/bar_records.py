@@ -0,0 +1,66 @@
+'''
+Module defining the compact record used while merging fetched market data
+Records keep request ids as structured data and are serialized once, when written
+'''
+
+import json
+
+class BarRecord:
+    '''
+    Merged market data of one bar:
+        symbol - ticker symbol
+        interval - aggregate time interval (second, minute, hour, day, etc.)
+        time - unix millisecond timestamp
+        fetch_time - time when the bar was retrieved
+        open, close, highest, lowest - bar prices, None for indicator-only records
+        volume - trading volume
+        vwap - volume weighed average price
+        number - number of transactions in aggregate window
+        indicators - indicator values per name (e.g. rsi14, sma5)
+        request_ids - polygon request ids per source (aggregate, rsi14, sma5)
+    '''
+    __slots__ = (
+        'symbol', 'interval', 'time', 'fetch_time', 'open', 'close', 'highest', 'lowest',
+        'volume', 'vwap', 'number', 'indicators', 'request_ids'
+    )
+
+    def __init__(self, symbol: str, interval: str, time: int, fetch_time: str):
+        self.symbol = symbol
+        self.interval = interval
+        self.time = time
+        self.fetch_time = fetch_time
+        self.open = None
+        self.close = None
+        self.highest = None
+        self.lowest = None
+        self.volume = None
+        self.vwap = None
+        self.number = None
+        self.indicators = {}
+        self.request_ids = {}
+
+    def get(self, field: str, default=None):
+        '''Function for dict-style reads of the fields shared with written logs'''
+        value = getattr(self, field, None) if field in self.__slots__ else None
+        return default if value is None else value
+
+    def to_log(self) -> dict:
+        '''Function that serializes the record into an aggregateLogs document'''
+        log = {
+            'symbol': self.symbol,
+            'interval': self.interval,
+            'time': str(self.time),
+            'fetchTime': self.fetch_time
+        }
+        if self.close is not None:
+            log['open'] = self.open
+            log['close'] = self.close
+            log['highest'] = self.highest
+            log['lowest'] = self.lowest
+            log['volume'] = self.volume
+            log['vwap'] = self.vwap
+            log['number'] = self.number
+        log.update(self.indicators)
+        log['options'] = json.dumps({'requestIds': self.request_ids})
+        log['details'] = ''
+        return log
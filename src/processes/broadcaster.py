@@ -0,0 +1,85 @@
+'''
+Module defining the in-process broadcaster feeding live subscriptions
+- One producer (ingestion and analytics rounds) fanned out to N subscribers
+- Bounded per-subscriber queues, slow consumers lose their oldest batches
+- Topics keyed by (channel, symbol, interval), so publishing never reads MongoDb
+'''
+
+import asyncio
+import os
+
+BROADCAST_QUEUE_SIZE = int(os.environ.get('BROADCAST_QUEUE_SIZE', 64))
+
+class Subscriber:
+    '''
+    Class holding the bounded queue of batches waiting to be sent to one subscriber
+    '''
+    __slots__ = ('queue', 'dropped')
+
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, batch: list):
+        '''Function that queues a batch, evicting the oldest queued batch when full'''
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(batch)
+
+class Broadcaster:
+    '''
+    Class handling the fan-out of written bars and analytics to live subscribers
+    - Group published documents per topic once, then hand the same batch to every subscriber
+    - Never block the publisher on a slow subscriber
+    '''
+    def __init__(self, queue_size: int = BROADCAST_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.topics = {}
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, channel: str, documents: list):
+        '''Function that sends documents (e.g. bars, analytics) to the subscribers of their topic'''
+        if not self.topics or not documents:
+            return
+
+        batches = {}
+        for document in documents:
+            topic = (channel, document['symbol'], document['interval'])
+            if topic in self.topics:
+                batches.setdefault(topic, []).append(document)
+
+        for topic, batch in batches.items():
+            batch.sort(key=lambda document: int(document['time']))
+            for subscriber in self.topics[topic]:
+                dropped = subscriber.dropped
+                subscriber.offer(batch)
+                self.dropped += subscriber.dropped - dropped
+            self.published += len(batch)
+
+    async def subscribe(self, channel: str, symbol: str, interval: str):
+        '''Async generator that yields batches published to a topic until the subscriber leaves'''
+        topic = (channel, symbol, interval)
+        subscriber = Subscriber(self.queue_size)
+        self.topics.setdefault(topic, set()).add(subscriber)
+        try:
+            while True:
+                yield await subscriber.queue.get()
+        finally:
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.topics[topic]
+
+    def stats(self) -> dict:
+        '''Function that reports subscriber, publish and drop counters'''
+        return {
+            'topics': len(self.topics),
+            'subscribers': sum(len(subscribers) for subscribers in self.topics.values()),
+            'published': self.published,
+            'dropped': self.dropped
+        }
+
+broadcaster = Broadcaster()
@@ -0,0 +1,170 @@
+'''
+Module defining the in-process indicator engine computed from stored and fetched bars
+- Relative strength index (RSI) with Wilder smoothing
+- Simple moving average (SMA)
+Every window is updated in the same pass from running state, one bar at a time
+'''
+
+import os
+from contextlib import aclosing
+import numpy as np
+from src.db.aggregate_logs import stream_aggregate_logs
+
+RSI_WINDOWS = np.array([6, 14, 24])
+SMA_WINDOWS = np.array([5, 100, 200])
+SEED_BARS = 600
+HISTORY_BARS = int(os.environ.get('INDICATOR_HISTORY_BARS', 16))
+PRECISION = 4
+
+class IndicatorState:
+    '''
+    Running indicator state of one close series:
+        time - unix millisecond timestamp of the last applied bar
+        closes - ring of the last closes, sized for the largest SMA window
+        count - number of applied bars
+        sums - running close sums per SMA window
+        gains - running gain sums during warmup, Wilder average gains afterwards
+        losses - running loss sums during warmup, Wilder average losses afterwards
+    '''
+    __slots__ = ('time', 'closes', 'count', 'sums', 'gains', 'losses')
+
+    def __init__(self):
+        self.time = None
+        self.closes = np.zeros(SMA_WINDOWS.max())
+        self.count = 0
+        self.sums = np.zeros(len(SMA_WINDOWS))
+        self.gains = np.zeros(len(RSI_WINDOWS))
+        self.losses = np.zeros(len(RSI_WINDOWS))
+
+    def copy(self):
+        '''Function that returns an independent copy of the state'''
+        state = IndicatorState()
+        state.time = self.time
+        state.closes = self.closes.copy()
+        state.count = self.count
+        state.sums = self.sums.copy()
+        state.gains = self.gains.copy()
+        state.losses = self.losses.copy()
+        return state
+
+    def push(self, time: int, close: float):
+        '''Function that applies a new bar close to every window'''
+        size = len(self.closes)
+        if self.count > 0:
+            change = close - self.closes[(self.count - 1) % size]
+            changes = self.count
+            warming = changes <= RSI_WINDOWS
+            self.gains = np.where(
+                warming,
+                self.gains + max(change, 0.0),
+                (self.gains * (RSI_WINDOWS - 1) + max(change, 0.0)) / RSI_WINDOWS
+            )
+            self.losses = np.where(
+                warming,
+                self.losses + max(-change, 0.0),
+                (self.losses * (RSI_WINDOWS - 1) + max(-change, 0.0)) / RSI_WINDOWS
+            )
+            seeded = changes == RSI_WINDOWS
+            self.gains = np.where(seeded, self.gains / RSI_WINDOWS, self.gains)
+            self.losses = np.where(seeded, self.losses / RSI_WINDOWS, self.losses)
+
+        outgoing = np.where(
+            self.count >= SMA_WINDOWS,
+            self.closes[(self.count - SMA_WINDOWS) % size],
+            0.0
+        )
+        self.sums += close - outgoing
+        self.closes[self.count % size] = close
+        self.count += 1
+        self.time = time
+
+    def values(self) -> dict:
+        '''Function that returns the indicator values of the last applied bar'''
+        values = {}
+        changes = self.count - 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(
+                self.losses == 0, 100.0, 100.0 - 100.0 / (1.0 + self.gains / self.losses)
+            )
+        for window, value in zip(RSI_WINDOWS, rsi):
+            if changes >= window:
+                values[f'rsi{window}'] = round(float(value), PRECISION)
+        for window, total in zip(SMA_WINDOWS, self.sums):
+            if self.count >= window:
+                values[f'sma{window}'] = round(float(total / window), PRECISION)
+
+        return values
+
+class IndicatorEngine:
+    '''
+    Class handling indicator state per (symbol, interval)
+    - Seed state from the stored close series
+    - Apply new bars incrementally, recomputing re-fetched or revised bars from the prior state
+    - Stage new state until the bars it was computed for are written
+    states maps each series to the states after its last applied bars, oldest first
+    '''
+    def __init__(self, history_bars: int = HISTORY_BARS):
+        self.history_bars = history_bars
+        self.states = {}
+        self.pending = {}
+
+    async def seed(self, symbol: str, interval: str, before_time: int) -> IndicatorState:
+        '''Function that builds state from the stored bars preceding before_time'''
+        closes = []
+        async with aclosing(stream_aggregate_logs(
+            symbol, '0', str(before_time - 1), interval, False, SEED_BARS
+        )) as logs:
+            async for log in logs:
+                if log.get('close') is not None:
+                    closes.append((int(log['time']), log['close']))
+                if len(closes) >= SEED_BARS:
+                    break
+
+        state = IndicatorState()
+        for time, close in reversed(closes):
+            state.push(time, close)
+
+        return state
+
+    async def update(self, symbol: str, interval: str, bars: list) -> dict:
+        '''
+        Function that applies contiguous (time, close) bars and returns indicator values per time
+        Bars are applied on the committed state preceding the oldest of them, which is seeded
+        from MongoDb when it is older than the kept states, the result is staged until commit
+        '''
+        bars = sorted(bars)
+        if not bars:
+            return {}
+
+        key = (symbol, interval)
+        first_time = bars[0][0]
+        states = [
+            state for state in self.states.get(key, [])
+            if state.time is None or state.time < first_time
+        ]
+        if not states:
+            states = [await self.seed(symbol, interval, first_time)]
+
+        state = states[-1].copy()
+        values_per_time = {}
+        for index, (time, close) in enumerate(bars):
+            state.push(time, close)
+            values_per_time[time] = state.values()
+            if index >= len(bars) - self.history_bars:
+                states.append(state.copy())
+
+        self.pending[key] = states[-self.history_bars:]
+        return values_per_time
+
+    def commit(self, series: list):
+        '''Function that keeps the staged state of (symbol, interval) series once written'''
+        for key in series:
+            if key in self.pending:
+                self.states[key] = self.pending.pop(key)
+
+    def discard(self, series: list):
+        '''Function that drops the staged state of series whose bars could not be written'''
+        for key in series:
+            self.pending.pop(key, None)
+
+indicator_engine = IndicatorEngine()
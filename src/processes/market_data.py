@@ -1,91 +1,201 @@
 '''
-Module defining background task that fetches market data for insertion
+Module defining ingestion rounds that fetch market data for insertion
 Additionally:
-- Sleep manager, which sets the sleep cycle for the task
+- Sleep manager, which sets the sleep cycle for the scheduler
 '''
 
 import json
+import logging
+import os
 import asyncio
-import textwrap
+import time as clock
 
-from datetime import datetime, timedelta, timezone, time
-from src.db.errors import insert_error
+from datetime import datetime, timedelta, timezone
+from src.db.error_sink import error_sink
 from src.db.aggregate_logs import upsert_aggregate_logs
+from src.cache.bar_buffer import bar_cache
+from src.cache.result_cache import result_cache
 from src.http.aggregates import get_bar_aggregates, BarAggregatesParams
 from src.http.rsi import get_rsi_data, RsiIndicatorParams
 from src.http.sma import get_sma_data, SmaIndicatorParams
+from src.processes.bar_records import BarRecord
+from src.processes.broadcaster import broadcaster
+from src.processes.indicators import indicator_engine
+from src.processes.rollups import update_rollups
+from src.processes.watermarks import watermark_tracker
+from src.utils.metrics import StageTimer, observe_stage
+from src.utils.structured_log import log_event
 
 PRECISION = 4
+MAX_AGGREGATES_LIMIT = 50000
+LOCAL_INDICATORS = os.environ.get('LOCAL_INDICATORS', 'true').lower() == 'true'
 
-async def process_market_data(
-    symbol: str, interval: str, batch_size: int, request_interval: int
-):
-    '''Function that uses polygon api to retrieve aggregate market data'''
-    while True:
-        try:
-            # TODO++: Remove " - timedelta(days=2)" once you have full API access
-            today = datetime.now(timezone.utc) - timedelta(days=2)
-            unix_today = str(int(today.timestamp() * 1000))
-            afterhours_close = time(0, 0, 0)
-            premarket_open = time(8, 0, 0)
-            is_market_closed = afterhours_close <= today.time() <= premarket_open
-            if today.weekday() < 5:
-                results = await fetch_market_data(symbol, today, interval, batch_size)
-                market_aggs = results[0]
-                market_rsi = results[1]
-                market_sma = results[2]
-                results_per_time = await parse_aggregate_data(
-                    symbol, interval, unix_today, market_aggs
+async def process_market_data(jobs: list, today: datetime, workers: int) -> int:
+    '''
+    Function that runs one shared fetch and write round for a batch of due ingestion jobs
+    Jobs are fetched and parsed concurrently by at most workers tasks,
+    then every new or changed log is written through a single bulk upsert
+    Written logs are published to live subscribers, touched rollup buckets are rebuilt afterwards
+    Returns the number of written logs
+    '''
+    started = clock.perf_counter()
+    unix_today = str(int(today.timestamp() * 1000))
+    semaphore = asyncio.Semaphore(workers)
+
+    async def collect(job):
+        async with semaphore:
+            try:
+                return await collect_market_data(
+                    job.symbol, job.interval, job.batch_size, today, unix_today
                 )
-                await parse_rsi_data(symbol, interval, unix_today, market_rsi, results_per_time)
-                await parse_sma_data(market_sma, results_per_time)
+            except Exception as e:
+                indicator_engine.discard([(job.symbol, job.interval)])
+                log_event(
+                    'ingestion_error', level=logging.ERROR, symbol=job.symbol,
+                    interval=job.interval, error=str(e)
+                )
+                error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
+                error_sink.report({
+                    'time': str(error_time),
+                    'description': f'Error processing {job.interval} market data on {job.symbol}',
+                    'source': 'src/processes/market_data.py - process_market_data',
+                    'details': str(e)
+                })
+                return []
 
-                await upsert_aggregate_logs(results_per_time.values())
+    results = await asyncio.gather(*[collect(job) for job in jobs])
+    logs = [log for job_logs in results for log in job_logs]
+    written = 0
+    series = [(job.symbol, job.interval) for job in jobs]
 
-                print(textwrap.dedent(f'''
-                    {symbol} - {today}
-                    Task complete - market data uploaded
-                '''))
+    if not logs:
+        indicator_engine.commit(series)
+    else:
+        try:
+            await upsert_aggregate_logs(logs)
+            indicator_engine.commit(series)
+            written = len(logs)
+            watermark_tracker.commit(logs)
+            bar_cache.update(logs)
+            result_cache.invalidate_logs(logs)
+            broadcaster.publish('bars', logs)
+        except Exception as e:
+            indicator_engine.discard(series)
+            log_event('upload_error', level=logging.ERROR, logs=len(logs), error=str(e))
+            error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
+            error_sink.report({
+                'time': str(error_time),
+                'description': 'Error uploading market data',
+                'source': 'src/processes/market_data.py - process_market_data',
+                'details': str(e)
+            })
 
-                await sleep_manager(is_market_closed, request_interval)
+        try:
+            with StageTimer('rollups', 'aggregateRollups', len(logs)):
+                await update_rollups(logs)
         except Exception as e:
-            print(f'An error occurred in db/aggregate_logs.py: {e}')
+            log_event('rollup_error', level=logging.ERROR, logs=len(logs), error=str(e))
             error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
-            await insert_error({
+            error_sink.report({
                 'time': str(error_time),
-                'description': 'Error processing minute market data',
+                'description': 'Error updating market data rollups',
                 'source': 'src/processes/market_data.py - process_market_data',
                 'details': str(e)
             })
-            await sleep_manager(is_market_closed, request_interval)
-
-async def sleep_manager(is_market_closed: bool, request_interval: int):
-    '''Function for setting background task sleep time'''
-    if is_market_closed:
-        print('Market closed - Next scan set to premarket open')
-        now = datetime.now(timezone.utc)
-        market_open = datetime(now.year, now.month, now.day + 1, 4, 0, tzinfo=timezone.utc)
-        seconds_to_open = (market_open - now).total_seconds()
-        await asyncio.sleep(seconds_to_open)
+
+    seconds = clock.perf_counter() - started
+    observe_stage('ingestion_round', 'aggregateLogs', seconds, len(logs))
+    log_event(
+        'ingestion_round', jobs=len(jobs), logs=len(logs), today=today.isoformat(),
+        seconds=round(seconds, 4)
+    )
+    return written
+
+async def collect_market_data(
+    symbol: str, interval: str, batch_size: int, today: datetime, unix_today: str
+) -> list:
+    '''
+    Function that fetches and parses market data newer than the series watermark, up to today
+    Only bars that are new or differ from the last written values are returned (with the bars
+    after them when indicators are computed locally), nothing is requested while the watermark
+    is ahead of today
+    Locally computed indicator state is staged until process_market_data writes the bars
+    '''
+    watermark = await watermark_tracker.get_watermark(symbol, interval)
+    if watermark is not None:
+        watermark -= watermark_tracker.overlap_ms(interval)
+        if watermark >= int(unix_today):
+            return []
+
+    if LOCAL_INDICATORS:
+        results = await fetch_market_data(symbol, today, interval, batch_size, watermark, False)
+        records = await merge_market_data(symbol, interval, unix_today, results[0])
+        with StageTimer('indicators', interval, len(records)):
+            await apply_indicators(symbol, interval, records)
+        with StageTimer('diff', interval, len(records)):
+            changed = watermark_tracker.diff(symbol, interval, records)
+            # Indicators of the bars following a revised bar change with it
+            first_changed = min(changed, default=None)
+            records = {
+                time: record for time, record in records.items()
+                if first_changed is not None and time >= first_changed
+            }
+    else:
+        results = await fetch_market_data(symbol, today, interval, batch_size, watermark, True)
+        records = await merge_market_data(
+            symbol, interval, unix_today, results[0], {'rsi14': results[1], 'sma5': results[2]}
+        )
+        with StageTimer('diff', interval, len(records)):
+            records = watermark_tracker.diff(symbol, interval, records)
+
+    return [record.to_log() for record in records.values()]
+
+async def apply_indicators(symbol: str, interval: str, records: dict):
+    '''Function that adds locally computed rsi and sma values to merged bar records'''
+    bars = [(time, record.close) for time, record in records.items() if record.close is not None]
+    indicators_per_time = await indicator_engine.update(symbol, interval, bars)
+    for time, indicators in indicators_per_time.items():
+        records[time].indicators.update(indicators)
+
+async def fetch_market_data(
+    symbol: str, today: datetime, interval: str, batch_size: int, since: int,
+    include_indicators: bool
+):
+    '''
+    Function for sending out multiple requests concurrently of market data
+    Aggregates are requested from the since timestamp up to today, or the last batch_size
+    bars of the day before today when the series has no stored bars yet
+    Polygon rsi and sma requests are only sent when include_indicators is set
+    '''
+    end = str(int(today.timestamp() * 1000))
+    if since is None:
+        yesterday = today - timedelta(days=1)
+        aggregates_params = BarAggregatesParams(
+            symbol=symbol,
+            window=1,
+            interval=interval,
+            start_date=str(int(yesterday.timestamp() * 1000)),
+            end_date=end,
+            order='desc',
+            limit=batch_size
+        )
     else:
-        await asyncio.sleep(request_interval)
+        aggregates_params = BarAggregatesParams(
+            symbol=symbol,
+            window=1,
+            interval=interval,
+            start_date=str(since),
+            end_date=end,
+            order='asc',
+            limit=MAX_AGGREGATES_LIMIT
+        )
+    aggregates_request = get_bar_aggregates(aggregates_params)
 
-async def fetch_market_data(symbol: str, today: datetime, interval: str, batch_size: int):
-    '''Function for sending out multiple requests concurrently of market data'''
-    yesterday = today - timedelta(days=1)
+    if not include_indicators:
+        return [await aggregates_request]
 
     results = await asyncio.gather(
-        get_bar_aggregates(
-            BarAggregatesParams(
-                symbol=symbol,
-                window=1,
-                interval=interval,
-                start_date=yesterday.strftime('%Y-%m-%d'),
-                end_date=today.strftime('%Y-%m-%d'),
-                order='desc',
-                limit=batch_size
-            )
-        ),
+        aggregates_request,
         get_rsi_data(
             RsiIndicatorParams(
                 symbol=symbol,
@@ -110,92 +220,57 @@ async def fetch_market_data(symbol: str, today: datetime, interval: str, batch_s
 
     return results
 
-async def parse_aggregate_data(symbol: str, interval: str, fetch_time: str, agg_json: dict) -> dict:
-    '''Function that specifically processes market price data based on interval and symbol'''
-    results_per_time = {}
+async def merge_market_data(
+    symbol: str, interval: str, fetch_time: str, agg_json: dict, indicator_jsons: dict = None
+) -> dict:
+    '''
+    Function that merges aggregate and indicator responses into bar records keyed by time
+    indicator_jsons maps indicator names (e.g. rsi14, sma5) to polygon indicator responses,
+    indicator timestamps without a matching bar produce indicator-only records
+    '''
+    started = clock.perf_counter()
+    records = {}
 
     if 'results' in agg_json:
-        for minute in agg_json['results']:
-            results_per_time[minute['t']] = {
-                'symbol': symbol,
-                'interval': interval,
-                'open': minute['o'],
-                'close': minute['c'],
-                'highest': minute['h'],
-                'lowest': minute['l'],
-                'volume': minute['v'],
-                'vwap': minute['vw'],
-                'time': str(minute['t']),
-                'fetchTime': fetch_time,
-                'number': minute['n'],
-                'options': json.dumps({
-                    'requestIds': {
-                        'aggregate': agg_json['request_id'],
-                    }
-                }),
-                'details': ''
-            }
+        request_id = agg_json.get('request_id')
+        for bar in agg_json['results']:
+            record = BarRecord(symbol, interval, bar['t'], fetch_time)
+            record.open = bar['o']
+            record.close = bar['c']
+            record.highest = bar['h']
+            record.lowest = bar['l']
+            record.volume = bar['v']
+            record.vwap = bar['vw']
+            record.number = bar['n']
+            record.request_ids['aggregate'] = request_id
+            records[bar['t']] = record
     else:
-        await insert_error({
+        error_sink.report({
             'time': fetch_time,
             'description': f'Error processing {interval} aggregate data on {symbol}',
-            'source': 'src/processes/market_data.py - parse_aggregate_data',
+            'source': 'src/processes/market_data.py - merge_market_data',
             'details': json.dumps(agg_json)
         })
 
-    return results_per_time
+    for name, indicator_json in (indicator_jsons or {}).items():
+        if 'results' not in indicator_json or 'values' not in indicator_json['results']:
+            error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
+            error_sink.report({
+                'time': str(error_time),
+                'description': f'Error processing {interval} {name} data on {symbol}',
+                'source': 'src/processes/market_data.py - merge_market_data',
+                'details': json.dumps(indicator_json)
+            })
+            continue
 
-async def parse_rsi_data(
-    symbol: str, interval: str, fetch_time: str, rsi_json: dict, results_per_time: dict
-):
-    '''Function that specifically processes rsi data based on interval and symbol'''
-    if 'results' in rsi_json and 'values' in rsi_json['results']:
-        for minute in rsi_json['results']['values']:
-            rsi14 = round(minute['value'], PRECISION)
-            if minute['timestamp'] in results_per_time:
-                results_per_time[minute['timestamp']]['rsi14'] = rsi14
-                options = json.loads(results_per_time[minute['timestamp']]['options'])
-                if 'requestIds' in options:
-                    options['requestIds']['rsi14'] = rsi_json['request_id']
-                    results_per_time[minute['timestamp']]['options'] = json.dumps(options)
-            else:
-                results_per_time[minute['timestamp']] = {
-                    'symbol': symbol,
-                    'interval': interval,
-                    'time': str(minute['timestamp']),
-                    'fetchTime': fetch_time,
-                    'rsi14': rsi14,
-                    'options': json.dumps({
-                        'requestIds': {
-                            'rsi14': rsi_json['request_id'],
-                        }
-                    }),
-                    'details': ''
-                }
-    else:
-        error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
-        await insert_error({
-            'time': str(error_time),
-            'description': 'Error processing minute rsi14 data',
-            'source': 'src/processes/market_data.py - parse_rsi_data',
-            'details': json.dumps(rsi_json)
-        })
+        request_id = indicator_json.get('request_id')
+        for value in indicator_json['results']['values']:
+            record = records.get(value['timestamp'])
+            if record is None:
+                record = BarRecord(symbol, interval, value['timestamp'], fetch_time)
+                records[value['timestamp']] = record
+            record.indicators[name] = round(value['value'], PRECISION)
+            record.request_ids[name] = request_id
 
-async def parse_sma_data(sma_json: dict, results_per_time: dict):
-    '''Function that specifically processes sma data based on interval and symbol'''
-    if 'results' in sma_json and 'values' in sma_json['results']:
-        for minute in sma_json['results']['values']:
-            sma5 = round(minute['value'], PRECISION)
-            results_per_time[minute['timestamp']]['sma5'] = sma5
-            options = json.loads(results_per_time[minute['timestamp']]['options'])
-            if 'requestIds' in options:
-                options['requestIds']['sma5'] = sma_json['request_id']
-                results_per_time[minute['timestamp']]['options'] = json.dumps(options)
-    else:
-        error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
-        await insert_error({
-            'time': str(error_time),
-            'description': 'Error processing minute sma data',
-            'source': 'src/processes/market_data.py - parse_sma_data',
-            'details': json.dumps(sma_json)
-        })
+    observe_stage('parse', interval, clock.perf_counter() - started, len(records))
+    return records
@@ -0,0 +1,201 @@
+'''
+Module defining the vectorized pattern detection engine used by price analytics
+- Rolling window features (Bollinger bands, Keltner channels, volume z-scores, rolling vwap)
+- Signal detection for RSI, Bollinger, moving average, vwap, volume and volatility patterns
+- Incremental evaluation of new bars against a cached tail of previous bars
+'''
+
+from contextlib import aclosing
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from src.cache.bar_buffer import stream_cached_aggregate_logs
+from src.db.analytics import get_latest_analytics_time
+from src.utils.interval_to_ms import interval_to_ms
+
+BAR_FIELDS = ('close', 'highest', 'lowest', 'volume', 'vwap', 'rsi14')
+BOLL_WINDOW = 20
+BOLL_DEVIATIONS = 2
+KELTNER_MULTIPLIER = 1.5
+SQUEEZE_LOOKBACK = 120
+FAST_MA_WINDOW = 5
+SLOW_MA_WINDOW = 20
+RSI_OVERSOLD = 30
+RSI_OVERBOUGHT = 70
+VOL_SPIKE_ZSCORE = 3
+VOL_DEAD_RATIO = 0.2
+TAIL_BARS = SQUEEZE_LOOKBACK + BOLL_WINDOW
+EXPIRATION_BARS = {
+    'RSI_OVERSOLD': 5,
+    'RSI_OVERBOUGHT': 5,
+    'VWAP': 5,
+    'BOLL_SQUEEZE': 10,
+    'TOP_BOLL': 5,
+    'MID_BOLL': 5,
+    'BOTTOM_BOLL': 5,
+    'MA': 10,
+    'VOL_SPIKE': 3,
+    'VOL_DEAD': 3,
+    'VI_SQUEEZE': 10
+}
+
+def rolling(values: np.ndarray, window: int, reducer) -> np.ndarray:
+    '''Function that applies reducer over trailing windows, NaN until a window is full'''
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[window - 1:] = reducer(sliding_window_view(values, window), axis=-1)
+    return result
+
+def crossed_above(values: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    '''Function that flags bars where values move from at/below levels to above them'''
+    crossed = np.zeros(len(values), dtype=bool)
+    crossed[1:] = (values[:-1] <= levels[:-1]) & (values[1:] > levels[1:])
+    return crossed
+
+def crossed_below(values: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    '''Function that flags bars where values move from at/above levels to below them'''
+    crossed = np.zeros(len(values), dtype=bool)
+    crossed[1:] = (values[:-1] >= levels[:-1]) & (values[1:] < levels[1:])
+    return crossed
+
+def entered(condition: np.ndarray) -> np.ndarray:
+    '''Function that flags bars where condition becomes true after being false'''
+    started = condition.copy()
+    started[1:] &= ~condition[:-1]
+    return started
+
+def detect_patterns(bars: dict) -> dict:
+    '''
+    Function that evaluates every pattern over bar arrays
+    Returns a boolean array and a details array per pattern type, aligned with bars
+    '''
+    close, high, low = bars['close'], bars['highest'], bars['lowest']
+    volume, vwap, rsi = bars['volume'], bars['vwap'], bars['rsi14']
+
+    middle = rolling(close, BOLL_WINDOW, np.mean)
+    deviation = rolling(close, BOLL_WINDOW, np.std)
+    upper = middle + BOLL_DEVIATIONS * deviation
+    lower = middle - BOLL_DEVIATIONS * deviation
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bandwidth = (upper - lower) / middle
+
+    previous_close = np.concatenate([[np.nan], close[:-1]])
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+    average_range = rolling(true_range, BOLL_WINDOW, np.mean)
+    keltner_upper = middle + KELTNER_MULTIPLIER * average_range
+    keltner_lower = middle - KELTNER_MULTIPLIER * average_range
+
+    volume_mean = rolling(volume, BOLL_WINDOW, np.mean)
+    volume_deviation = rolling(volume, BOLL_WINDOW, np.std)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        volume_zscore = (volume - volume_mean) / volume_deviation
+        volume_ratio = volume / volume_mean
+        rolling_vwap = rolling(vwap * volume, BOLL_WINDOW, np.sum) / rolling(volume, BOLL_WINDOW, np.sum)
+
+    fast_ma = rolling(close, FAST_MA_WINDOW, np.mean)
+    slow_ma = rolling(close, SLOW_MA_WINDOW, np.mean)
+    squeeze_floor = rolling(bandwidth, SQUEEZE_LOOKBACK, np.min)
+
+    with np.errstate(invalid='ignore'):
+        signals = {
+            'RSI_OVERSOLD': crossed_below(rsi, np.full(len(rsi), RSI_OVERSOLD)),
+            'RSI_OVERBOUGHT': crossed_above(rsi, np.full(len(rsi), RSI_OVERBOUGHT)),
+            'VWAP': crossed_above(close, rolling_vwap) | crossed_below(close, rolling_vwap),
+            'BOLL_SQUEEZE': bandwidth <= squeeze_floor,
+            'TOP_BOLL': crossed_above(close, upper),
+            'MID_BOLL': crossed_above(close, middle) | crossed_below(close, middle),
+            'BOTTOM_BOLL': crossed_below(close, lower),
+            'MA': crossed_above(fast_ma, slow_ma) | crossed_below(fast_ma, slow_ma),
+            'VOL_SPIKE': volume_zscore >= VOL_SPIKE_ZSCORE,
+            'VOL_DEAD': volume_ratio <= VOL_DEAD_RATIO,
+            'VI_SQUEEZE': entered((upper < keltner_upper) & (lower > keltner_lower))
+        }
+    details = {
+        'RSI_OVERSOLD': lambda i: f'RSI14 {rsi[i]:.2f} crossed below {RSI_OVERSOLD}',
+        'RSI_OVERBOUGHT': lambda i: f'RSI14 {rsi[i]:.2f} crossed above {RSI_OVERBOUGHT}',
+        'VWAP': lambda i: f'Close {close[i]:.4f} crossed {BOLL_WINDOW}-bar vwap {rolling_vwap[i]:.4f}',
+        'BOLL_SQUEEZE': lambda i: f'Bollinger bandwidth {bandwidth[i]:.6f} lowest in {SQUEEZE_LOOKBACK} bars',
+        'TOP_BOLL': lambda i: f'Close {close[i]:.4f} crossed above upper band {upper[i]:.4f}',
+        'MID_BOLL': lambda i: f'Close {close[i]:.4f} crossed middle band {middle[i]:.4f}',
+        'BOTTOM_BOLL': lambda i: f'Close {close[i]:.4f} crossed below lower band {lower[i]:.4f}',
+        'MA': lambda i: f'SMA{FAST_MA_WINDOW} {fast_ma[i]:.4f} crossed SMA{SLOW_MA_WINDOW} {slow_ma[i]:.4f}',
+        'VOL_SPIKE': lambda i: f'Volume {volume[i]:.0f} z-score {volume_zscore[i]:.2f}',
+        'VOL_DEAD': lambda i: f'Volume {volume[i]:.0f} at {volume_ratio[i]:.2f}x {BOLL_WINDOW}-bar mean',
+        'VI_SQUEEZE': lambda i: 'Bollinger bands moved inside Keltner channels'
+    }
+
+    return {pattern: (signals[pattern], details[pattern]) for pattern in signals}
+
+class PatternDetector:
+    '''
+    Class handling incremental pattern detection per (symbol, interval)
+    - Keep the last bars needed by the longest rolling window
+    - Evaluate only new or revised bars and build analytics entries
+    - Warm up on the stored tail after a restart, emitting only bars newer than stored analytics
+    '''
+    def __init__(self):
+        self.tails = {}
+
+    async def load_bars(self, symbol: str, interval: str, since: int) -> list:
+        '''Function that reads bars from since onwards, or the last TAIL_BARS bars, oldest first'''
+        start = '0' if since is None else str(since)
+        logs = []
+        async with aclosing(stream_cached_aggregate_logs(
+            symbol, start, str(np.iinfo(np.int64).max), interval, False
+        )) as stream:
+            async for log in stream:
+                if log.get('close') is None:
+                    continue
+                logs.append(log)
+                if since is None and len(logs) >= TAIL_BARS:
+                    break
+
+        return logs[::-1]
+
+    async def analyze(self, symbol: str, interval: str) -> list:
+        '''Function that detects patterns on bars that arrived since the last call'''
+        key = (symbol, interval)
+        tail = self.tails.get(key)
+        since = None if tail is None else int(tail['time'][-1])
+        logs = await self.load_bars(symbol, interval, since)
+        if not logs:
+            return []
+
+        new_bars = {'time': np.array([int(log['time']) for log in logs], dtype=np.int64)}
+        for field in BAR_FIELDS:
+            new_bars[field] = np.array(
+                [np.nan if log.get(field) is None else log[field] for log in logs], dtype=float
+            )
+
+        if tail is None:
+            # The first tail only warms the windows up, bars analyzed before are not emitted again
+            analyzed = await get_latest_analytics_time(symbol, interval)
+            bars = new_bars
+            first_new = len(bars['time']) - 1 if analyzed is None else \
+                int(np.searchsorted(bars['time'], analyzed, side='right'))
+        else:
+            kept = tail['time'] < new_bars['time'][0]
+            bars = {
+                field: np.concatenate([tail[field][kept], new_bars[field]]) for field in new_bars
+            }
+            first_new = int(kept.sum())
+
+        self.tails[key] = {field: values[-TAIL_BARS:] for field, values in bars.items()}
+
+        interval_ms = interval_to_ms(interval)
+        analytics = []
+        for pattern, (signals, details) in detect_patterns(bars).items():
+            for index in np.flatnonzero(signals[first_new:]) + first_new:
+                time = int(bars['time'][index])
+                analytics.append({
+                    'time': str(time),
+                    'expiration': str(time + EXPIRATION_BARS[pattern] * interval_ms),
+                    'type': pattern,
+                    'interval': interval,
+                    'details': details(index),
+                    'symbol': symbol
+                })
+
+        return analytics
+
+pattern_detector = PatternDetector()
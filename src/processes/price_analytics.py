@@ -1,54 +1,66 @@
 '''
-Module defining background task that fetches market data for insertion
-Additionally:
-- Sleep manager, which sets the sleep cycle for the task
+Module defining background task that analyzes stored market data for patterns
+Bars are evaluated incrementally by the pattern detector and written as analytics
 '''
 
-import json
 import asyncio
-import textwrap
+import logging
+import time as clock
 
-from datetime import datetime, timedelta, timezone, time
-from src.db.errors import insert_error
-from src.db.aggregate_logs import upsert_aggregate_logs
-from src.http.aggregates import get_bar_aggregates, BarAggregatesParams
-from src.http.rsi import get_rsi_data, RsiIndicatorParams
-from src.http.sma import get_sma_data, SmaIndicatorParams
+from datetime import datetime, timezone
+from src.db.error_sink import error_sink
+from src.db.analytics import upsert_analytics_data
+from src.cache.result_cache import result_cache
+from src.processes.broadcaster import broadcaster
+from src.processes.patterns import pattern_detector
+from src.processes.scheduler import (
+    get_market_today, is_market_closed, seconds_to_poll, sleep_until_open, POLL_OFFSET
+)
+from src.utils.market_clock import market_clock
+from src.utils.metrics import StageTimer, observe_stage
+from src.utils.structured_log import log_event
 
-PRECISION = 4
-
-async def analyze_price_data(
-    symbol: str, interval: str, batch_size: int, request_interval: int
-):
-    '''Function that processes market data stored in the db to find useful analytics'''
+async def analyze_price_data(series: list, request_interval: int):
+    '''
+    Function that processes market data stored in the db to find useful analytics
+    Rounds are aligned to request_interval boundaries, after the ingestion polls of the same bars
+    '''
     while True:
-        try:
-            # TODO++: Remove " - timedelta(days=2)" once you have full API access
-            today = datetime.now(timezone.utc) - timedelta(days=2)
-            unix_today = str(int(today.timestamp() * 1000))
-            afterhours_close = time(0, 0, 0)
-            premarket_open = time(8, 0, 0)
-            is_market_closed = afterhours_close <= today.time() <= premarket_open
-            if today.weekday() < 5:
-                await sleep_manager(is_market_closed, request_interval)
-        except Exception as e:
-            print(f'An error occurred in db/aggregate_logs.py: {e}')
-            error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
-            await insert_error({
-                'time': str(error_time),
-                'description': 'Error processing minute market data',
-                'source': 'src/processes/market_data.py - process_market_data',
-                'details': str(e)
-            })
-            await sleep_manager(is_market_closed, request_interval)
+        today = get_market_today()
+        if is_market_closed(today):
+            await sleep_until_open(today)
+            continue
+
+        started = clock.perf_counter()
+        detected = 0
+        for symbol, interval in series:
+            try:
+                with StageTimer('patterns', interval, 1):
+                    analytics = await pattern_detector.analyze(symbol, interval)
+                if analytics:
+                    await upsert_analytics_data(analytics)
+                    result_cache.invalidate_logs(analytics)
+                    broadcaster.publish('analytics', analytics)
+                    detected += len(analytics)
+            except Exception as e:
+                log_event(
+                    'analytics_error', level=logging.ERROR, symbol=symbol, interval=interval,
+                    error=str(e)
+                )
+                error_time = int((datetime.now(timezone.utc)).timestamp() * 1000)
+                error_sink.report({
+                    'time': str(error_time),
+                    'description': f'Error analyzing {interval} market data on {symbol}',
+                    'source': 'src/processes/price_analytics.py - analyze_price_data',
+                    'details': str(e)
+                })
+
+        seconds = clock.perf_counter() - started
+        observe_stage('analytics_round', 'analytics', seconds, detected)
+        log_event(
+            'analytics_round', series=len(series), analytics=detected, today=today.isoformat(),
+            seconds=round(seconds, 4)
+        )
 
-async def sleep_manager(is_market_closed: bool, request_interval: int):
-    '''Function for setting background task sleep time'''
-    if is_market_closed:
-        print('Market closed - Next scan set to premarket open')
-        now = datetime.now(timezone.utc)
-        market_open = datetime(now.year, now.month, now.day + 1, 4, 0, tzinfo=timezone.utc)
-        seconds_to_open = (market_open - now).total_seconds()
-        await asyncio.sleep(seconds_to_open)
-    else:
-        await asyncio.sleep(request_interval)
+        seconds = seconds_to_poll(get_market_today(), request_interval * 1000, 2 * POLL_OFFSET)
+        await asyncio.sleep(market_clock.to_real(seconds))
@@ -0,0 +1,315 @@
+'''
+Module defining multi-timeframe rollups built from ingested base interval bars
+- Vectorized OHLCV + VWAP rollup of bar arrays into coarser buckets,
+  daily and longer buckets aligned to exchange (America/New_York) days
+- Incremental rollup updates for the buckets touched by newly written bars
+- Query routing to the coarsest stored resolution that fits a requested interval
+'''
+
+import os
+from contextlib import aclosing
+from datetime import datetime, timezone
+import numpy as np
+from src.cache.bar_buffer import (
+    stream_cached_aggregate_logs, get_cached_aggregate_columns, get_cached_symbols_aggregate_logs,
+    SERIES_FIELDS
+)
+from src.cache.result_cache import result_cache
+from src.db.rollups import upsert_rollups, stream_rollups, stream_symbols_rollups
+from src.processes.broadcaster import broadcaster
+from src.utils.interval_to_ms import interval_to_ms, parse_interval
+from src.utils.market_calendar import EXCHANGE_TIMEZONE
+
+ROLLUP_BASE_INTERVAL = os.environ.get('ROLLUP_BASE_INTERVAL', 'minute')
+ROLLUP_INTERVALS = [
+    interval.strip().lower()
+    for interval in os.environ.get('ROLLUP_INTERVALS', '5minute,15minute,1hour,1day').split(',')
+    if interval.strip()
+]
+# Intervals of the ingested (watchlist) series, the rollup base interval is always ingested
+INGESTED_INTERVALS = {
+    entry.partition(':')[2].strip().lower() or 'minute'
+    for entry in os.environ.get('WATCHLIST', 'SPY:minute').split(',')
+    if entry.strip()
+} | {ROLLUP_BASE_INTERVAL}
+ROLLUP_FIELDS = ('open', 'close', 'highest', 'lowest', 'volume', 'vwap', 'number')
+HOUR_MS = 3600000
+DAY_MS = 86400000
+
+def exchange_offsets(times: np.ndarray) -> np.ndarray:
+    '''Function that returns the exchange UTC offset in milliseconds at unix millisecond times'''
+    # Offsets only change on hour boundaries, so they are computed once per distinct hour
+    hours, inverse = np.unique(times // HOUR_MS, return_inverse=True)
+    offsets = [
+        datetime.fromtimestamp(hour * 3600, timezone.utc).astimezone(EXCHANGE_TIMEZONE)
+        .utcoffset().total_seconds() * 1000
+        for hour in hours.tolist()
+    ]
+    return np.array(offsets, dtype=np.int64)[inverse]
+
+def bucket_starts(times: np.ndarray, interval_ms: int) -> np.ndarray:
+    '''
+    Function that returns the start of the interval_ms bucket containing each time
+    Buckets of a day or more start at exchange midnights so that daily bars match sessions,
+    shorter buckets are aligned to UTC
+    '''
+    if interval_ms < DAY_MS:
+        return times - times % interval_ms
+
+    local = times + exchange_offsets(times)
+    local_starts, inverse = np.unique(local - local % interval_ms, return_inverse=True)
+    starts = [
+        datetime.fromtimestamp(start / 1000, timezone.utc).replace(tzinfo=EXCHANGE_TIMEZONE)
+        .timestamp() * 1000
+        for start in local_starts.tolist()
+    ]
+    return np.array(starts, dtype=np.int64)[inverse]
+
+def bucket_start(time: int, interval_ms: int) -> int:
+    '''Function that returns the start of the interval_ms bucket containing time'''
+    return int(bucket_starts(np.array([time], dtype=np.int64), interval_ms)[0])
+
+def bucket_end(time: int, interval_ms: int) -> int:
+    '''Function that returns the last millisecond of the interval_ms bucket containing time'''
+    # Half a bucket of margin lands in the next bucket whatever the daylight saving shifts
+    return bucket_start(bucket_start(time, interval_ms) + interval_ms * 3 // 2, interval_ms) - 1
+
+def logs_to_arrays(logs: list) -> dict:
+    '''Function that converts logs (oldest first) into bar arrays, skipping bars without prices'''
+    logs = [log for log in logs if log.get('close') is not None]
+    arrays = {'time': np.array([int(log['time']) for log in logs], dtype=np.int64)}
+    for field in ROLLUP_FIELDS:
+        arrays[field] = np.array(
+            [np.nan if log.get(field) is None else log[field] for log in logs], dtype=float
+        )
+
+    return arrays
+
+def rollup_arrays(arrays: dict, interval_ms: int) -> dict:
+    '''Function that aggregates bar arrays (oldest first) into interval_ms bucket arrays'''
+    buckets = bucket_starts(arrays['time'], interval_ms)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+
+    volume = np.nan_to_num(arrays['volume'])
+    volume_sum = np.add.reduceat(volume, starts)
+    weighted = np.add.reduceat(np.nan_to_num(arrays['vwap'] * volume), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = np.where(volume_sum > 0, weighted / volume_sum, arrays['close'][ends])
+    return {
+        'time': buckets[starts],
+        'open': arrays['open'][starts],
+        'close': arrays['close'][ends],
+        'highest': np.fmax.reduceat(arrays['highest'], starts),
+        'lowest': np.fmin.reduceat(arrays['lowest'], starts),
+        'volume': volume_sum,
+        'vwap': np.round(vwap, 4),
+        'number': np.add.reduceat(np.nan_to_num(arrays['number']), starts)
+    }
+
+def rollup_bars(arrays: dict, symbol: str, interval: str, fetch_time: str) -> list:
+    '''Function that aggregates bar arrays (oldest first) into interval bucket logs, oldest first'''
+    if not len(arrays['time']):
+        return []
+
+    columns = rollup_arrays(arrays, interval_to_ms(interval))
+    columns = {field: values.tolist() for field, values in columns.items()}
+
+    return [
+        {
+            'symbol': symbol,
+            'interval': interval,
+            'time': str(columns['time'][index]),
+            'fetchTime': fetch_time,
+            'open': columns['open'][index],
+            'close': columns['close'][index],
+            'highest': columns['highest'][index],
+            'lowest': columns['lowest'][index],
+            'volume': columns['volume'][index],
+            'vwap': columns['vwap'][index],
+            'number': int(columns['number'][index]),
+            'options': '{}',
+            'details': ''
+        }
+        for index in range(len(columns['time']))
+    ]
+
+async def update_rollups(logs: list):
+    '''
+    Function that rebuilds the rollup buckets touched by newly written base interval logs
+    Every base bar of each touched bucket (including bars after the written ones, e.g. when
+    backfilling) is read from the bar cache, or MongoDb when not cached
+    '''
+    ranges = {}
+    for log in logs:
+        if log['interval'] != ROLLUP_BASE_INTERVAL or log.get('close') is None:
+            continue
+        time = int(log['time'])
+        first_time, last_time = ranges.get(log['symbol'], (time, time))
+        ranges[log['symbol']] = (min(first_time, time), max(last_time, time))
+
+    if not ranges or not ROLLUP_INTERVALS:
+        return
+
+    fetch_time = str(int((datetime.now(timezone.utc)).timestamp() * 1000))
+    widest_ms = max(interval_to_ms(interval) for interval in ROLLUP_INTERVALS)
+    rollups = []
+    for symbol, (first_time, last_time) in ranges.items():
+        start = bucket_start(first_time, widest_ms)
+        end = bucket_end(last_time, widest_ms)
+        base_logs = [
+            log async for log in stream_cached_aggregate_logs(
+                symbol, str(start), str(end), ROLLUP_BASE_INTERVAL, False, ROLLUP_FIELDS
+            )
+        ]
+        arrays = logs_to_arrays(base_logs[::-1])
+        for interval in ROLLUP_INTERVALS:
+            interval_ms = interval_to_ms(interval)
+            touched = arrays['time'] >= bucket_start(first_time, interval_ms)
+            window = {field: values[touched] for field, values in arrays.items()}
+            rollups.extend(rollup_bars(window, symbol, interval, fetch_time))
+
+    if rollups:
+        await upsert_rollups(rollups)
+        result_cache.invalidate_logs(rollups)
+        broadcaster.publish('bars', rollups)
+
+def resolve_interval_source(interval: str) -> tuple:
+    '''
+    Function that decides where bars of a requested interval come from:
+        ('raw', interval) - ingested bars of that interval
+        ('rollup', interval) - materialized rollup bars
+        ('aggregate', source) - bars of the coarsest stored resolution dividing interval,
+                                aggregated when read
+    Unit names resolve like 1<unit> (hour -> 1hour) unless that unit is ingested itself
+    '''
+    multiplier, unit = parse_interval(interval)
+    interval_ms = interval_to_ms(interval)
+    if interval_ms is None:
+        return 'raw', interval
+    if multiplier == 1 and unit in INGESTED_INTERVALS:
+        return 'raw', unit
+    if interval_ms == interval_to_ms(ROLLUP_BASE_INTERVAL):
+        return 'raw', ROLLUP_BASE_INTERVAL
+
+    rollups = [rollup for rollup in ROLLUP_INTERVALS if interval_to_ms(rollup) == interval_ms]
+    if rollups:
+        return 'rollup', rollups[0]
+
+    base_ms = interval_to_ms(ROLLUP_BASE_INTERVAL)
+    sources = [
+        rollup for rollup in ROLLUP_INTERVALS
+        if interval_to_ms(rollup) < interval_ms and interval_ms % interval_to_ms(rollup) == 0
+    ]
+    if sources:
+        return 'aggregate', max(sources, key=interval_to_ms)
+    if interval_ms % base_ms == 0:
+        return 'aggregate', ROLLUP_BASE_INTERVAL
+
+    return 'raw', unit if multiplier == 1 else interval.strip().lower()
+
+async def stream_interval_logs(
+    symbol: str, start: str, end: str, interval: str, is_mocked: bool, fields: tuple = None
+):
+    '''
+    Async generator that streams bars of any interval within specified range, newest first
+    Multiples of the base interval are served from the coarsest stored resolution that fits,
+    including the bucket that contains start
+    fields limits the fields read from MongoDb, bars aggregated on read are returned whole
+    and built one bucket at a time, so memory use does not grow with the range
+    '''
+    kind, source = resolve_interval_source(interval)
+    if is_mocked is True or kind == 'raw':
+        async for log in stream_cached_aggregate_logs(
+            symbol, start, end, source, is_mocked, fields
+        ):
+            yield log
+        return
+
+    interval = interval.strip().lower()
+    interval_ms = interval_to_ms(interval)
+    aligned_start = str(bucket_start(int(start), interval_ms))
+    if kind == 'rollup':
+        async for log in stream_rollups(symbol, aligned_start, end, source, fields=fields):
+            yield log
+        return
+
+    if source in ROLLUP_INTERVALS:
+        source_logs = stream_rollups(symbol, aligned_start, end, source, fields=ROLLUP_FIELDS)
+    else:
+        source_logs = stream_cached_aggregate_logs(
+            symbol, aligned_start, end, source, False, ROLLUP_FIELDS
+        )
+
+    # Source bars arrive newest first, each bucket is aggregated as soon as an older one starts
+    fetch_time = str(int((datetime.now(timezone.utc)).timestamp() * 1000))
+    bucket_logs, first_time = [], None
+
+    def flush() -> list:
+        return rollup_bars(logs_to_arrays(bucket_logs[::-1]), symbol, interval, fetch_time)
+
+    async with aclosing(source_logs) as logs:
+        async for log in logs:
+            if bucket_logs and int(log['time']) < first_time:
+                for bar in flush():
+                    yield bar
+                bucket_logs = []
+            if not bucket_logs:
+                first_time = bucket_start(int(log['time']), interval_ms)
+            bucket_logs.append(log)
+
+    for bar in flush():
+        yield bar
+
+async def get_symbols_interval_logs(
+    symbols: list, start: str, end: str, interval: str, is_mocked: bool, fields: tuple = None
+) -> dict:
+    '''
+    Function that retrieves bars of any interval for several symbols, newest first per symbol
+    Every symbol is read through one batched query of the resolution stream_interval_logs uses,
+    bars aggregated on read are returned whole
+    '''
+    kind, source = resolve_interval_source(interval)
+    if is_mocked is True or kind == 'raw':
+        return await get_cached_symbols_aggregate_logs(
+            symbols, start, end, source, is_mocked, fields
+        )
+
+    interval = interval.strip().lower()
+    aligned_start = str(bucket_start(int(start), interval_to_ms(interval)))
+    if kind == 'aggregate' and source not in ROLLUP_INTERVALS:
+        source_logs = await get_cached_symbols_aggregate_logs(
+            symbols, aligned_start, end, source, False, ROLLUP_FIELDS
+        )
+    else:
+        source_logs = {symbol: [] for symbol in symbols}
+        async with aclosing(stream_symbols_rollups(
+            symbols, aligned_start, end, source,
+            fields=fields if kind == 'rollup' else ROLLUP_FIELDS
+        )) as rollups:
+            async for rollup in rollups:
+                source_logs[rollup['symbol']].append(rollup)
+
+    if kind == 'rollup':
+        return source_logs
+
+    fetch_time = str(int((datetime.now(timezone.utc)).timestamp() * 1000))
+    return {
+        symbol: rollup_bars(logs_to_arrays(logs[::-1]), symbol, interval, fetch_time)[::-1]
+        for symbol, logs in source_logs.items()
+    }
+
+async def get_interval_columns(
+    symbol: str, start: str, end: str, interval: str, is_mocked: bool, fields: tuple = None
+) -> dict:
+    '''Function that retrieves bars of any interval within range as columns, oldest first'''
+    kind, source = resolve_interval_source(interval)
+    if is_mocked is True or kind == 'raw':
+        return await get_cached_aggregate_columns(symbol, start, end, source, is_mocked, fields)
+
+    columns = {field: [] for field in SERIES_FIELDS}
+    async for log in stream_interval_logs(symbol, start, end, interval, is_mocked, fields):
+        for field, values in columns.items():
+            values.append(log.get(field))
+
+    return {field: values[::-1] for field, values in columns.items()}
@@ -0,0 +1,164 @@
+'''
+Module defining the ingestion scheduler that drives market data rounds for a watchlist
+- Watchlist parsing into (symbol, interval) ingestion jobs
+- Due job batching into shared fetch and write rounds on a bounded worker pool
+- Bar-aligned polls, fired POLL_OFFSET seconds after each bar (or the session) closes
+- Market calendar aware sleeps until the next session open
+- Per-job lag reporting, exported as the ingestion lag gauge
+'''
+
+import asyncio
+import logging
+import os
+import time as clock
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List
+from src.processes.market_data import process_market_data
+from src.utils.interval_to_ms import interval_to_ms
+from src.utils.market_calendar import market_calendar
+from src.utils.market_clock import market_clock
+from src.utils.metrics import INGESTION_LAG
+from src.utils.structured_log import log_event
+
+WATCHLIST = os.environ.get('WATCHLIST', 'SPY:minute')
+SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', 8))
+INGESTION_BATCH_SIZE = int(os.environ.get('INGESTION_BATCH_SIZE', 15))
+POLL_OFFSET = float(os.environ.get('POLL_OFFSET', 2))
+LAG_WARNING_SECONDS = 5
+
+@dataclass
+class IngestionJob:
+    '''
+    Scheduled ingestion job:
+        symbol - ticker symbol
+        interval - aggregate time interval (second, minute, hour, day, etc.)
+        batch_size - number of bars requested per round
+        next_run - monotonic time when the job is next due
+        lag - seconds the job's last round started after it was due
+    '''
+    symbol: str
+    interval: str
+    batch_size: int
+    next_run: float = field(default_factory=clock.monotonic)
+    lag: float = 0.0
+
+def parse_watchlist(watchlist: str, batch_size: int = INGESTION_BATCH_SIZE) -> List[IngestionJob]:
+    '''
+    Function that converts a watchlist string into ingestion jobs
+    Watchlist example: SPY:minute,QQQ:minute,AAPL:hour
+    '''
+    jobs = []
+    for entry in watchlist.split(','):
+        if not entry.strip():
+            continue
+        symbol, _, interval = entry.strip().partition(':')
+        interval = interval or 'minute'
+        jobs.append(IngestionJob(
+            symbol=symbol.upper(),
+            interval=interval,
+            batch_size=batch_size
+        ))
+
+    return jobs
+
+def get_market_today() -> datetime:
+    '''Function that returns the market time ingestion and analytics rounds are run for'''
+    today = market_clock.now()
+    if not market_clock.simulated:
+        # TODO++: Remove " - timedelta(days=2)" once you have full API access
+        today -= timedelta(days=2)
+    return today
+
+def is_market_closed(today: datetime) -> bool:
+    '''
+    Function that checks whether no market data is produced at given time
+    Polls up to POLL_OFFSET seconds after the session close still belong to the session,
+    the grace does not apply before the session open
+    '''
+    if market_calendar.is_open(today):
+        return False
+    return not market_calendar.is_open(today - timedelta(seconds=POLL_OFFSET))
+
+def seconds_to_poll(today: datetime, interval_ms: int, offset: float = POLL_OFFSET) -> float:
+    '''
+    Function that returns the market seconds until offset after the next interval_ms bar close,
+    the session close is used instead when it comes first
+    '''
+    today_ms = int(today.timestamp() * 1000)
+    bar_close = (today_ms // interval_ms + 1) * interval_ms
+    session = market_calendar.get_session(today)
+    if session is not None:
+        session_close = int(session[1].timestamp() * 1000)
+        if today_ms < session_close:
+            bar_close = min(bar_close, session_close)
+
+    return (bar_close - today_ms) / 1000 + offset
+
+async def sleep_until_open(today: datetime):
+    '''Function that sleeps until POLL_OFFSET seconds after the session following today opens'''
+    market_open = market_calendar.next_open(today)
+    seconds = (market_open - today).total_seconds() + POLL_OFFSET
+    log_event('market_closed', until=market_open.isoformat(), seconds=round(seconds))
+    await asyncio.sleep(market_clock.to_real(seconds))
+
+class IngestionScheduler:
+    '''
+    Class handling ingestion rounds for every job of a watchlist
+    - Run due jobs together in shared rounds
+    - Report per-job lag
+    '''
+    def __init__(self, jobs: List[IngestionJob], workers: int = SCHEDULER_WORKERS):
+        self.jobs = jobs
+        self.workers = workers
+
+    async def run(self):
+        '''Function that runs ingestion rounds whenever jobs are due'''
+        while True:
+            today = get_market_today()
+            if is_market_closed(today):
+                await sleep_until_open(today)
+                self.reset()
+                continue
+
+            now = clock.monotonic()
+            due_jobs = [job for job in self.jobs if job.next_run <= now]
+            if not due_jobs:
+                await asyncio.sleep(min(job.next_run for job in self.jobs) - now)
+                continue
+
+            for job in due_jobs:
+                job.lag = now - job.next_run
+            self.report_lag(due_jobs)
+
+            await process_market_data(due_jobs, today, self.workers)
+
+            finished, today = clock.monotonic(), get_market_today()
+            for job in due_jobs:
+                seconds = seconds_to_poll(today, interval_to_ms(job.interval))
+                job.next_run = finished + market_clock.to_real(seconds)
+
+    def reset(self):
+        '''Function that makes every job due immediately'''
+        now = clock.monotonic()
+        for job in self.jobs:
+            job.next_run = now
+            job.lag = 0.0
+
+    def get_lag(self) -> dict:
+        '''Function that returns the last lag in seconds per (symbol, interval)'''
+        return {(job.symbol, job.interval): job.lag for job in self.jobs}
+
+    def report_lag(self, due_jobs: List[IngestionJob]):
+        '''Function that exports job lag and logs jobs whose rounds start late'''
+        for job in due_jobs:
+            INGESTION_LAG.labels(job.symbol, job.interval).set(job.lag)
+
+        lagging = [job for job in due_jobs if job.lag > LAG_WARNING_SECONDS]
+        if lagging:
+            worst = max(lagging, key=lambda job: job.lag)
+            log_event(
+                'scheduler_behind', level=logging.WARNING, lagging=len(lagging),
+                due=len(due_jobs), worst=f'{worst.symbol}:{worst.interval}',
+                lag=round(worst.lag, 1)
+            )
@@ -0,0 +1,76 @@
+'''
+Module defining per-series ingestion watermarks
+- High-water mark of the newest written bar per (symbol, interval)
+- Last written bar values, used to drop unchanged bars before writing
+'''
+
+import os
+from contextlib import aclosing
+import numpy as np
+from src.db.aggregate_logs import stream_aggregate_logs
+from src.utils.interval_to_ms import interval_to_ms
+
+INGESTION_OVERLAP_BARS = int(os.environ.get('INGESTION_OVERLAP_BARS', 3))
+SIGNATURE_FIELDS = ('open', 'close', 'highest', 'lowest', 'volume', 'vwap', 'number')
+
+def bar_signature(log: dict) -> tuple:
+    '''Function that returns the upstream values of a bar log or record, ignoring fetch metadata'''
+    return tuple(log.get(field) for field in SIGNATURE_FIELDS)
+
+class WatermarkTracker:
+    '''
+    Class handling ingestion progress per (symbol, interval)
+    - Seed watermarks from the newest stored bar
+    - Filter fetched bars down to new or changed ones
+    - Advance watermarks once bars are written
+    '''
+    def __init__(self, overlap_bars: int = INGESTION_OVERLAP_BARS):
+        self.overlap_bars = overlap_bars
+        self.watermarks = {}
+        self.signatures = {}
+
+    def overlap_ms(self, interval: str) -> int:
+        '''Function that returns how far before the watermark bars are re-requested'''
+        return self.overlap_bars * interval_to_ms(interval)
+
+    async def get_watermark(self, symbol: str, interval: str) -> int:
+        '''Function that returns the newest written bar time of a series, None if it has none'''
+        key = (symbol, interval)
+        if key not in self.watermarks:
+            self.watermarks[key] = None
+            self.signatures[key] = {}
+            async with aclosing(stream_aggregate_logs(
+                symbol, '0', str(np.iinfo(np.int64).max), interval, False, 1
+            )) as logs:
+                async for log in logs:
+                    self.watermarks[key] = int(log['time'])
+                    break
+
+        return self.watermarks[key]
+
+    def diff(self, symbol: str, interval: str, records: dict) -> dict:
+        '''Function that keeps the merged bars which are new or differ from the last written values'''
+        signatures = self.signatures.get((symbol, interval), {})
+        return {
+            time: record for time, record in records.items()
+            if signatures.get(int(time)) != bar_signature(record)
+        }
+
+    def commit(self, logs: list):
+        '''Function that records written bars and advances watermarks past them'''
+        for log in logs:
+            key = (log['symbol'], log['interval'])
+            time = int(log['time'])
+            self.signatures.setdefault(key, {})[time] = bar_signature(log)
+            watermark = self.watermarks.get(key)
+            if watermark is None or time > watermark:
+                self.watermarks[key] = time
+
+        for key in {(log['symbol'], log['interval']) for log in logs}:
+            oldest = self.watermarks[key] - self.overlap_ms(key[1])
+            self.signatures[key] = {
+                time: signature for time, signature in self.signatures[key].items()
+                if time >= oldest
+            }
+
+watermark_tracker = WatermarkTracker()
@@ -0,0 +1,61 @@
+'''
+Module that defines the backfill API routes
+- Backfill job creation, run in the background at bulk priority
+- Backfill job progress retrieval
+'''
+
+import asyncio
+from typing import List
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from src.processes.backfill import create_backfill_job, get_backfill_job, run_backfill_job
+
+router = APIRouter()
+running_jobs = {}
+
+class BackfillRequest(BaseModel):
+    '''
+    Backfill job request body:
+        symbols - ticker symbols
+        start - first day to backfill (YYYY-MM-DD)
+        end - last day to backfill (YYYY-MM-DD)
+        interval - aggregate time interval (second, minute, hour, day, etc.)
+    '''
+    symbols: List[str]
+    start: str
+    end: str
+    interval: str = 'minute'
+
+def start_backfill_task(job_id: str):
+    '''Function that runs a backfill job in the background, keeping a reference to its task'''
+    task = asyncio.create_task(run_backfill_job(job_id))
+    running_jobs[job_id] = task
+    task.add_done_callback(lambda _: running_jobs.pop(job_id, None))
+
+@router.post('/backfill')
+async def create_backfill(request: BackfillRequest):
+    '''Route that creates and starts a backfill job, invalid requests are rejected with 400'''
+    symbols = [symbol.strip().upper() for symbol in request.symbols if symbol.strip()]
+    try:
+        job_id = await create_backfill_job(symbols, request.interval, request.start, request.end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    start_backfill_task(job_id)
+    return {'jobId': job_id}
+
+@router.post('/backfill/{job_id}/resume')
+async def resume_backfill(job_id: str):
+    '''Route that resumes the unfinished chunks of a backfill job'''
+    if await get_backfill_job(job_id) is None:
+        raise HTTPException(status_code=404, detail='Backfill job not found')
+    if job_id not in running_jobs:
+        start_backfill_task(job_id)
+    return {'jobId': job_id}
+
+@router.get('/backfill/{job_id}')
+async def read_backfill(job_id: str):
+    '''Route that returns backfill job progress'''
+    job = await get_backfill_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Backfill job not found')
+    return job
@@ -0,0 +1,222 @@
+'''
+Module that defines the bulk history export routes
+- aggregateLogs bars (any interval) and analytics for a symbol set and time range
+- CSV, Arrow IPC stream and Parquet output, encoded chunk by chunk straight from MongoDb cursors
+- Range resumption from the last received (symbol, time)
+Rows are exported symbol by symbol (in sorted order), newest first within a symbol,
+so memory use is bounded by EXPORT_CHUNK_ROWS whatever the range
+Arrow and Parquet output require pyarrow
+'''
+
+import csv
+import io
+import os
+from contextlib import aclosing
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from src.db.analytics import stream_analytics
+from src.db.bar_buckets import FLOAT_FIELDS
+from src.gql.stock_query import IS_MOCKED
+from src.processes.rollups import stream_interval_logs
+from src.utils.interval_to_ms import interval_to_ms
+from src.utils.metrics import StageTimer
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 10000))
+DATASETS = {
+    # dataset: (exported fields, time fields, integer fields, float fields)
+    'bars': (
+        ('symbol', 'interval', 'time', 'fetchTime', *FLOAT_FIELDS, 'number', 'options', 'details'),
+        ('time', 'fetchTime'),
+        ('number',),
+        FLOAT_FIELDS
+    ),
+    'analytics': (
+        ('symbol', 'interval', 'time', 'expiration', 'type', 'details'),
+        ('time', 'expiration'),
+        (),
+        ()
+    )
+}
+MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+router = APIRouter()
+
+class ChunkSink(io.RawIOBase):
+    '''
+    Write-only file object buffering encoded bytes until they are drained into the response,
+    positions keep counting across drains for writers recording offsets (Parquet)
+    '''
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        '''Function that returns and forgets the buffered bytes'''
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def get_arrow_schema(dataset: str):
+    '''Function that returns the typed Arrow schema of a dataset'''
+    fields, time_fields, int_fields, float_fields = DATASETS[dataset]
+    types = {}
+    for field in fields:
+        if field in time_fields:
+            types[field] = pa.timestamp('ms', tz='UTC')
+        elif field in int_fields:
+            types[field] = pa.int64()
+        elif field in float_fields:
+            types[field] = pa.float64()
+        else:
+            types[field] = pa.string()
+    return pa.schema(list(types.items()))
+
+def to_record_batch(dataset: str, schema, rows: list):
+    '''Function that converts a chunk of documents into an Arrow record batch'''
+    fields, time_fields, int_fields, float_fields = DATASETS[dataset]
+    columns = []
+    for field in fields:
+        values = [row.get(field) for row in rows]
+        if field in time_fields or field in int_fields:
+            values = [None if value in (None, '') else int(value) for value in values]
+        elif field in float_fields:
+            values = [None if value is None else float(value) for value in values]
+        columns.append(pa.array(values, type=schema.field(field).type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+async def stream_rows(
+    dataset: str, symbols: list, start: str, end: str, interval: str, after: tuple
+):
+    '''
+    Async generator that yields documents of every symbol within range
+    Symbols before the after symbol are skipped, the after symbol resumes below its time
+    (at its time for analytics, whose rows can share a time)
+    '''
+    fields = DATASETS[dataset][0]
+    for symbol in symbols:
+        symbol_end = end
+        if after is not None:
+            if symbol < after[0]:
+                continue
+            if symbol == after[0]:
+                symbol_end = min(
+                    end, str(after[1] if dataset == 'analytics' else after[1] - 1), key=int
+                )
+
+        if dataset == 'bars':
+            stream = stream_interval_logs(symbol, start, symbol_end, interval, IS_MOCKED, fields)
+        else:
+            stream = stream_analytics(symbol, start, symbol_end, interval, IS_MOCKED, fields=fields)
+        async with aclosing(stream) as documents:
+            async for document in documents:
+                yield document
+
+async def encode_chunks(dataset: str, output: str, rows):
+    '''Async generator that encodes rows into output format bytes, one chunk at a time'''
+    fields = DATASETS[dataset][0]
+    sink = ChunkSink()
+    writer = None
+    if output == 'arrow':
+        schema = get_arrow_schema(dataset)
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+    elif output == 'parquet':
+        schema = get_arrow_schema(dataset)
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+    else:
+        text = io.StringIO()
+        csv_writer = csv.DictWriter(text, fields, extrasaction='ignore')
+        csv_writer.writeheader()
+
+    chunk = []
+
+    def flush() -> bytes:
+        if output == 'csv':
+            csv_writer.writerows(chunk)
+            data = text.getvalue().encode()
+            text.seek(0)
+            text.truncate()
+            return data
+        batch = to_record_batch(dataset, schema, chunk)
+        if output == 'arrow':
+            writer.write_batch(batch)
+        else:
+            writer.write_batch(batch, row_group_size=EXPORT_CHUNK_ROWS)
+        return sink.drain()
+
+    with StageTimer('export', f'{dataset}:{output}') as timer:
+        async with aclosing(rows) as documents:
+            async for document in documents:
+                chunk.append(document)
+                if len(chunk) >= EXPORT_CHUNK_ROWS:
+                    timer.items += len(chunk)
+                    yield flush()
+                    chunk = []
+        if chunk or output == 'csv':
+            timer.items += len(chunk)
+            yield flush()
+        if writer is not None:
+            writer.close()
+            yield sink.drain()
+
+def parse_after(after: str) -> tuple:
+    '''Function that parses a SYMBOL:TIME resume token'''
+    symbol, _, time = after.rpartition(':')
+    if not symbol or not time.isdigit():
+        raise HTTPException(status_code=400, detail='after must be SYMBOL:TIME')
+    return symbol.upper(), int(time)
+
+@router.get('/export/{dataset}')
+async def export_history(
+    dataset: str, symbols: str, start: str, end: str, interval: str = 'minute',
+    output: str = Query('csv', alias='format'), after: str = None
+):
+    '''
+    Route that streams bars or analytics of comma separated symbols within [start, end]
+    (unix millisecond timestamps) as csv, arrow (IPC stream) or parquet
+    An interrupted export resumes with after=SYMBOL:TIME of the last received row
+    '''
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f'Unknown dataset {dataset}')
+    if output not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f'Unknown format {output}')
+    if output != 'csv' and pa is None:
+        raise HTTPException(status_code=501, detail=f'{output} export requires pyarrow')
+    if not start.isdigit() or not end.isdigit():
+        raise HTTPException(status_code=400, detail='start and end must be unix milliseconds')
+    if not interval_to_ms(interval):
+        raise HTTPException(status_code=400, detail=f'Unknown interval {interval}')
+
+    symbol_list = sorted({
+        symbol.strip().upper() for symbol in symbols.split(',') if symbol.strip()
+    })
+    rows = stream_rows(
+        dataset, symbol_list, start, end, interval, parse_after(after) if after else None
+    )
+    filename = f'{dataset}-{interval}-{start}-{end}.{output}'
+    return StreamingResponse(
+        encode_chunks(dataset, output, rows),
+        media_type=MEDIA_TYPES[output],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,13 @@
+'''
+Module that defines the Prometheus metrics route
+'''
+
+from fastapi import APIRouter, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+router = APIRouter()
+
+@router.get('/metrics')
+async def get_metrics():
+    '''Route exposing every registered metric in the Prometheus text format'''
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,135 @@
+'''
+Util module that defines visual downsampling of columnar bar data for charting
+- lttb: Largest-Triangle-Three-Buckets selection of representative bars on close
+- ohlc: min/max bucket aggregation of bars into candles, preserving wicks
+'''
+
+import numpy as np
+
+OHLC_FIELDS = ('open', 'close', 'highest', 'lowest', 'volume', 'vwap', 'number')
+
+def to_array(values: list) -> np.ndarray:
+    '''Util function to convert a list of optional numbers into a float array (None -> nan)'''
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+def to_list(values: np.ndarray) -> list:
+    '''Util function to convert a float array into a list of optional numbers (nan -> None)'''
+    return [None if value != value else value for value in values.tolist()]
+
+def bucket_starts(length: int, buckets: int) -> np.ndarray:
+    '''Util function to split length rows into at most buckets contiguous, equally sized buckets'''
+    return np.unique(np.linspace(0, length, buckets + 1).astype(np.int64)[:-1])
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    '''
+    Util function returning the indices of the threshold points picked by LTTB
+    First and last points are always kept, every bucket in between contributes the point
+    forming the largest triangle with the previous pick and the next bucket average
+    '''
+    length = len(y)
+    if threshold >= length:
+        return np.arange(length)
+    if threshold < 3:
+        return np.array([0, length - 1][-threshold:], dtype=np.int64)
+
+    y = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+    edges = np.append(1 + bucket_starts(length - 2, threshold - 2), length - 1)
+    x_means = np.add.reduceat(x[1:-1], edges[:-1] - 1) / np.diff(edges)
+    y_means = np.add.reduceat(y[1:-1], edges[:-1] - 1) / np.diff(edges)
+    x_means = np.append(x_means[1:], x[-1])
+    y_means = np.append(y_means[1:], y[-1])
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, length - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        areas = np.abs(
+            (x[previous] - x_means[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (y_means[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+
+    return indices
+
+def downsample_lttb(columns: dict, max_points: int) -> dict:
+    '''Util function to downsample columns (oldest first) to the bars LTTB picks on close'''
+    length = len(columns['time'])
+    if length <= max_points:
+        return columns
+
+    x = np.array([int(time) for time in columns['time']], dtype=float)
+    indices = lttb_indices(x, to_array(columns['close']), max_points).tolist()
+    return {field: [values[index] for index in indices] for field, values in columns.items()}
+
+def downsample_ohlc(columns: dict, max_points: int) -> dict:
+    '''
+    Util function to aggregate columns (oldest first) into at most max_points candles
+    Candles take the first open and time, last close, highest high, lowest low,
+    summed volume and transactions and volume weighed vwap of their bucket,
+    any other field (e.g. indicators) takes the value of the last bar in the bucket
+    '''
+    length = len(columns['time'])
+    if length <= max_points:
+        return columns
+
+    starts = bucket_starts(length, max_points)
+    ends = np.append(starts[1:], length) - 1
+    downsampled = {
+        field: [values[index] for index in ends.tolist()]
+        for field, values in columns.items()
+        if field not in OHLC_FIELDS
+    }
+    downsampled['time'] = [columns['time'][index] for index in starts.tolist()]
+
+    if 'open' in columns:
+        downsampled['open'] = to_list(to_array(columns['open'])[starts])
+    if 'close' in columns:
+        downsampled['close'] = to_list(to_array(columns['close'])[ends])
+    if 'highest' in columns:
+        downsampled['highest'] = to_list(np.fmax.reduceat(to_array(columns['highest']), starts))
+    if 'lowest' in columns:
+        downsampled['lowest'] = to_list(np.fmin.reduceat(to_array(columns['lowest']), starts))
+    if 'volume' in columns:
+        volume = np.nan_to_num(to_array(columns['volume']))
+        volume_sum = np.add.reduceat(volume, starts)
+        downsampled['volume'] = volume_sum.tolist()
+        if 'vwap' in columns:
+            vwap = to_array(columns['vwap'])
+            weighted = np.add.reduceat(np.nan_to_num(vwap * volume), starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                downsampled['vwap'] = to_list(np.round(
+                    np.where(volume_sum > 0, weighted / volume_sum, vwap[ends]), 4
+                ))
+    elif 'vwap' in columns:
+        downsampled['vwap'] = to_list(to_array(columns['vwap'])[ends])
+    if 'number' in columns:
+        number = np.add.reduceat(np.nan_to_num(to_array(columns['number'])), starts)
+        downsampled['number'] = [int(value) for value in number.tolist()]
+
+    return downsampled
+
+def downsample_columns(columns: dict, max_points: int, method: str = 'ohlc') -> dict:
+    '''Util function to downsample columns (oldest first) with the lttb or ohlc method'''
+    if max_points is None or max_points < 1:
+        return columns
+    if method == 'lttb':
+        return downsample_lttb(columns, max_points)
+
+    return downsample_ohlc(columns, max_points)
+
+def downsample_logs(logs: list, max_points: int, method: str = 'ohlc') -> list:
+    '''Util function to downsample logs (newest first), returned newest first'''
+    if max_points is None or max_points < 1 or len(logs) <= max_points:
+        return logs
+
+    logs = logs[::-1]
+    columns = {field: [log.get(field) for log in logs] for field in logs[0]}
+    columns = downsample_columns(columns, max_points, method)
+    fields = list(columns)
+
+    return [
+        dict(zip(fields, row))
+        for row in zip(*(columns[field] for field in fields))
+    ][::-1]
@@ -2,19 +2,36 @@
 Util module that defines a function for converting interval strings into millisecond integers
 '''
 
+import re
+
+INTERVAL_PATTERN = re.compile(r'^(\d*)\s*([a-z]+)$')
+
+def parse_interval(interval: str):
+    '''
+    Util function to split interval strings into multiplier and unit
+    (e.g. minute -> (1, minute), 15minute -> (15, minute))
+    '''
+    match = INTERVAL_PATTERN.match(interval.strip().lower())
+    if match is None:
+        return None, None
+
+    multiplier, unit = match.groups()
+    return int(multiplier or 1), unit
+
 def interval_to_ms(interval: str):
     '''
     Util function to convert interval strings to milliseconds integer
-    (e.g. second, minute, hour, day, etc.)
+    (e.g. second, minute, hour, day, etc., optionally prefixed by a multiplier such as 15minute)
     '''
-    match interval.lower():
+    multiplier, unit = parse_interval(interval)
+    match unit:
         case 'second':
-            return 1000
+            return multiplier * 1000
         case 'minute':
-            return 60000
+            return multiplier * 60000
         case 'hour':
-            return 3600000
+            return multiplier * 3600000
         case 'day':
-            return 86400000
+            return multiplier * 86400000
         case 'week':
-            return 604800000
+            return multiplier * 604800000
@@ -0,0 +1,143 @@
+'''
+Util module that defines the exchange session calendar (NYSE rules, America/New_York time)
+- Weekends, full-day holidays (with weekend observance) and 1 p.m. early closes
+- Sessions precomputed per year as unix millisecond (open, close) pairs
+- Session lookup and next open search by binary search
+MARKET_SESSION selects 'extended' (04:00-20:00, the polygon.io pre/after-hours window)
+or 'regular' (09:30-16:00) sessions
+'''
+
+import bisect
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+MARKET_SESSION = os.environ.get('MARKET_SESSION', 'extended')
+EXCHANGE_TIMEZONE = ZoneInfo('America/New_York')
+SESSION_HOURS = {
+    # session: (open, close, early close)
+    'extended': (time(4, 0), time(20, 0), time(17, 0)),
+    'regular': (time(9, 30), time(16, 0), time(13, 0))
+}
+
+def nth_weekday(year: int, month: int, weekday: int, nth: int) -> date:
+    '''Util function to return the nth (1-based, -1 for last) weekday of a month'''
+    if nth > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (nth - 1))
+
+    following = date(year + month // 12, month % 12 + 1, 1)
+    last = following - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def easter(year: int) -> date:
+    '''Util function to return the Gregorian Easter Sunday (anonymous Gregorian algorithm)'''
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def observed(day: date) -> date:
+    '''Util function to move Saturday holidays to Friday and Sunday holidays to Monday'''
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+def get_holidays(year: int) -> set:
+    '''Util function to return the full-day exchange holidays of a year'''
+    holidays = {
+        nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter(year) - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed(date(year, 7, 4)),  # Independence Day
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving Day
+        observed(date(year, 12, 25))  # Christmas Day
+    }
+    if year >= 2022:
+        holidays.add(observed(date(year, 6, 19)))  # Juneteenth
+    # New Year's Day falling on a Saturday is not observed on the previous Friday
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(observed(new_year))
+
+    return holidays
+
+def get_early_closes(year: int) -> set:
+    '''Util function to return the early close days of a year (before July 4th and Christmas)'''
+    return {
+        date(year, 7, 3),
+        nth_weekday(year, 11, 3, 4) + timedelta(days=1),
+        date(year, 12, 24)
+    }
+
+def to_ms(day: date, at: time) -> int:
+    '''Util function to return the unix milliseconds of an exchange local day and time'''
+    return int(datetime.combine(day, at, EXCHANGE_TIMEZONE).timestamp() * 1000)
+
+class MarketCalendar:
+    '''
+    Class handling exchange sessions:
+        session - 'extended' or 'regular' session hours
+        years - (opens, closes) session millisecond lists per year, built once per year
+    '''
+    def __init__(self, session: str = MARKET_SESSION):
+        self.session = session
+        self.years = {}
+
+    def get_year(self, year: int) -> tuple:
+        '''Function that returns the sorted (opens, closes) of a year, computing them once'''
+        if year not in self.years:
+            open_at, close_at, early_close_at = SESSION_HOURS[self.session]
+            holidays = get_holidays(year)
+            early_closes = get_early_closes(year)
+            opens, closes = [], []
+            day = date(year, 1, 1)
+            while day.year == year:
+                if day.weekday() < 5 and day not in holidays:
+                    opens.append(to_ms(day, open_at))
+                    closes.append(to_ms(day, early_close_at if day in early_closes else close_at))
+                day += timedelta(days=1)
+            self.years[year] = (opens, closes)
+
+        return self.years[year]
+
+    def get_session(self, moment: datetime) -> tuple:
+        '''Function that returns the (open, close) datetimes of the session containing moment'''
+        moment_ms = int(moment.timestamp() * 1000)
+        opens, closes = self.get_year(moment.astimezone(EXCHANGE_TIMEZONE).year)
+        index = bisect.bisect_right(opens, moment_ms) - 1
+        if index < 0 or moment_ms > closes[index]:
+            return None
+
+        return (
+            datetime.fromtimestamp(opens[index] / 1000, timezone.utc),
+            datetime.fromtimestamp(closes[index] / 1000, timezone.utc)
+        )
+
+    def is_open(self, moment: datetime) -> bool:
+        '''Function that checks whether moment is within a session, close included'''
+        return self.get_session(moment) is not None
+
+    def next_open(self, moment: datetime) -> datetime:
+        '''Function that returns the next session open after moment'''
+        moment_ms = int(moment.timestamp() * 1000)
+        year = moment.astimezone(EXCHANGE_TIMEZONE).year
+        for candidate in (year, year + 1):
+            opens, _ = self.get_year(candidate)
+            index = bisect.bisect_right(opens, moment_ms)
+            if index < len(opens):
+                return datetime.fromtimestamp(opens[index] / 1000, timezone.utc)
+
+        raise ValueError(f'No session after {moment.isoformat()}')
+
+market_calendar = MarketCalendar()
@@ -0,0 +1,50 @@
+'''
+Util module that defines the market clock driving ingestion rounds
+Real time by default, or a simulated session clock for soak tests against the polygon simulator:
+SIMULATION_START (ISO datetime, UTC when no offset is given) sets the simulated time at startup,
+SIMULATION_ACCELERATION makes simulated time run N times faster than real time
+The simulator must be started with the same start and acceleration
+'''
+
+import os
+import time as clock
+from datetime import datetime, timedelta, timezone
+
+SIMULATION_START = os.environ.get('SIMULATION_START')
+SIMULATION_ACCELERATION = float(os.environ.get('SIMULATION_ACCELERATION', 1))
+
+def parse_start(value: str) -> datetime:
+    '''Util function to parse an ISO datetime, defaulting to UTC'''
+    start = datetime.fromisoformat(value)
+    return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+
+class MarketClock:
+    '''
+    Class handling (simulated) market time:
+        start - simulated time at creation, real time when None
+        acceleration - simulated seconds per real second
+    '''
+    def __init__(self, start: datetime = None, acceleration: float = 1.0):
+        self.start = start
+        self.acceleration = acceleration
+        self.started = clock.time()
+
+    @property
+    def simulated(self) -> bool:
+        '''Whether the clock runs simulated time'''
+        return self.start is not None or self.acceleration != 1.0
+
+    def now(self) -> datetime:
+        '''Function that returns the current (simulated) UTC time'''
+        if not self.simulated:
+            return datetime.now(timezone.utc)
+        start = self.start or datetime.fromtimestamp(self.started, timezone.utc)
+        return start + timedelta(seconds=(clock.time() - self.started) * self.acceleration)
+
+    def to_real(self, seconds: float) -> float:
+        '''Function that converts a simulated duration into real seconds'''
+        return seconds / self.acceleration
+
+market_clock = MarketClock(
+    parse_start(SIMULATION_START) if SIMULATION_START else None, SIMULATION_ACCELERATION
+)
@@ -0,0 +1,136 @@
+'''
+Util module that defines the Prometheus metrics of the service
+- Stage timing histograms and item counters (polygon fetch, parse, bulk_write, mongo reads, graphql)
+- Stage observations passed on to registered stage observers (benchmarks)
+- Ingestion lag per series, component stats (caches, sinks) exported as gauges
+- Event loop lag monitor measuring how long callbacks block the loop
+'''
+
+import asyncio
+import os
+import time as clock
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+LOOP_MONITOR_INTERVAL = float(os.environ.get('LOOP_MONITOR_INTERVAL', 0.25))
+STAGE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30
+)
+
+STAGE_SECONDS = Histogram(
+    'marketroach_stage_seconds', 'Duration of pipeline stages', ['stage', 'target'],
+    buckets=STAGE_BUCKETS
+)
+STAGE_ITEMS = Counter(
+    'marketroach_stage_items', 'Items (bars, documents, requests) handled by pipeline stages',
+    ['stage', 'target']
+)
+POLYGON_RESPONSES = Counter(
+    'marketroach_polygon_responses', 'Polygon.io responses by endpoint and status',
+    ['endpoint', 'status']
+)
+BAR_CACHE_READS = Counter(
+    'marketroach_bar_cache_reads', 'Bar cache range reads by result (hit, partial, miss)',
+    ['result']
+)
+INGESTION_LAG = Gauge(
+    'marketroach_ingestion_lag_seconds', 'Seconds the last ingestion round started late',
+    ['symbol', 'interval']
+)
+EVENT_LOOP_LAG = Histogram(
+    'marketroach_event_loop_lag_seconds', 'Delay of loop monitor wakeups past their schedule',
+    buckets=STAGE_BUCKETS
+)
+EVENT_LOOP_BLOCKED = Counter(
+    'marketroach_event_loop_blocked_seconds', 'Total seconds the event loop was blocked'
+)
+# Callables (stage, target, seconds, items) also receiving every stage observation (benchmarks)
+stage_observers = []
+
+class StageTimer:
+    '''
+    Class timing one pipeline stage into STAGE_SECONDS, usable as a (sync) context manager
+    around awaited calls, items can be added before exiting
+    '''
+    __slots__ = ('stage', 'target', 'items', 'started')
+
+    def __init__(self, stage: str, target: str = '', items: int = 0):
+        self.stage = stage
+        self.target = target
+        self.items = items
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = clock.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_stage(self.stage, self.target, clock.perf_counter() - self.started, self.items)
+        return False
+
+def observe_stage(stage: str, target: str, seconds: float, items: int = 0):
+    '''Util function to record a stage duration measured elsewhere'''
+    STAGE_SECONDS.labels(stage, target).observe(seconds)
+    if items:
+        STAGE_ITEMS.labels(stage, target).inc(items)
+    for observer in stage_observers:
+        observer(stage, target, seconds, items)
+
+class StatsCollector:
+    '''
+    Class exporting stats() dictionaries of registered components as gauges
+    (e.g. result_cache hits -> marketroach_result_cache_hits)
+    '''
+    def __init__(self):
+        self.sources = {}
+
+    def register(self, name: str, stats):
+        '''Function that registers a callable returning a dict of numbers under name'''
+        self.sources[name] = stats
+
+    def collect(self):
+        '''Function called by the Prometheus registry on every scrape'''
+        for name, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    yield GaugeMetricFamily(f'marketroach_{name}_{key}', f'{name} {key}', value=value)
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+class LoopMonitor:
+    '''
+    Class measuring event loop blocking
+    A task sleeps interval seconds at a time, any extra delay before it wakes up
+    is time the loop spent running other callbacks without yielding
+    '''
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL):
+        self.interval = interval
+        self.task: asyncio.Task = None
+
+    async def start(self):
+        '''Function that starts the monitor task'''
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        '''Function that stops the monitor task'''
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        '''Function that records how late every wakeup is'''
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled)
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_BLOCKED.inc(lag)
+
+loop_monitor = LoopMonitor()
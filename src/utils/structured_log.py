@@ -0,0 +1,55 @@
+'''
+Util module that defines sampled structured (JSON lines) logging for hot paths
+Events are written to stdout as one JSON object per line, routine events can be sampled
+so that logging cost stays bounded under load
+'''
+
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+logger = logging.getLogger('marketroach')
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+if not logger.handlers:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+def log_event(event: str, sample_rate: float = 1.0, level: int = logging.INFO, **fields):
+    '''
+    Util function to log an event with fields as a JSON line
+    Only a sample_rate fraction of calls is written, the rate is added to the line
+    so that counts can be scaled back up
+    '''
+    if not logger.isEnabledFor(level) or (sample_rate < 1.0 and random.random() >= sample_rate):
+        return
+
+    record = {
+        'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'event': event,
+        **fields
+    }
+    if sample_rate < 1.0:
+        record['sampleRate'] = sample_rate
+    logger.log(level, json.dumps(record, default=str))
+
+def log_write(collection: str, result):
+    '''Util function to log a sampled bulk write, insert_many or insert_one result'''
+    if hasattr(result, 'inserted_ids'):
+        fields = {'inserted': len(result.inserted_ids)}
+    elif hasattr(result, 'inserted_id'):
+        fields = {'inserted': 1}
+    else:
+        fields = {
+            'matched': result.matched_count,
+            'modified': result.modified_count,
+            'upserted': result.upserted_count
+        }
+    log_event('write', LOG_SAMPLE_RATE, collection=collection, **fields)
@@ -0,0 +1,268 @@
+'''
+Util module that defines the seeded synthetic market data generator
+- Vectorized random-walk OHLCV bars of the base interval (minute, and finer intervals),
+  generated per block so any range can be served, following a seeded trend
+  and bridged between seeded block boundary prices so blocks connect
+- Coarser intervals rolled up from the base bars like live rollups, so every interval agrees
+- rsi14/sma5 indicators and analytics patterns computed on the generated closes
+- Mocked aggregate logs and analytics, newest first, for the IS_MOCKED path and data seeding
+The same seed and symbol always produce the same bars, whatever interval and range are requested
+'''
+
+import os
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+import numpy as np
+from src.utils.interval_to_ms import interval_to_ms
+
+MOCK_SEED = int(os.environ.get('MOCK_SEED', 0))
+DAY_MS = 86400000
+BASE_INTERVAL_MS = 60000
+BLOCK_BARS = 1024
+MINUTE_VOLATILITY = 0.0008
+# Slow price trend of every symbol: (period in days, log price amplitude)
+TREND_WAVES = ((30, 0.05), (90, 0.1), (365, 0.2))
+RSI_WINDOW = 14
+SMA_WINDOW = 5
+WARMUP_BARS = 10 * RSI_WINDOW
+BAR_FIELDS = ('t', 'o', 'c', 'h', 'l', 'v', 'vw', 'n')
+LOG_FIELDS = {
+    'time': 't', 'open': 'o', 'close': 'c', 'highest': 'h', 'lowest': 'l',
+    'volume': 'v', 'vwap': 'vw', 'number': 'n'
+}
+
+def is_rolled_up(interval_ms: int) -> bool:
+    '''Util function to check whether bars of an interval are rolled up from base interval bars'''
+    return interval_ms > BASE_INTERVAL_MS and interval_ms % BASE_INTERVAL_MS == 0
+
+def get_block_ms(interval_ms: int) -> int:
+    '''
+    Util function to return the generation block length, a day or BLOCK_BARS bars,
+    a day or one bar for rolled up intervals
+    '''
+    if is_rolled_up(interval_ms):
+        return max(DAY_MS, interval_ms)
+    return max(DAY_MS, interval_ms * BLOCK_BARS)
+
+def trend_prices(symbol_hash: int, times: np.ndarray, seed: int) -> np.ndarray:
+    '''Util function to return the log base price of a symbol moved by seeded trend waves'''
+    phases = np.random.default_rng([seed, symbol_hash]).uniform(0, 2 * np.pi, len(TREND_WAVES))
+    trend = sum(
+        amplitude * np.sin(2 * np.pi * times / (period * DAY_MS) + phase)
+        for (period, amplitude), phase in zip(TREND_WAVES, phases)
+    )
+    return np.log(50 + symbol_hash % 450) + trend
+
+def boundary_noise(symbol_hash: int, time: int, seed: int) -> float:
+    '''Util function to return the seeded log price deviation from the trend at a block boundary'''
+    day_volatility = MINUTE_VOLATILITY * np.sqrt(DAY_MS / 60000)
+    rng = np.random.default_rng([seed, symbol_hash, time % 2 ** 63])
+    return rng.normal(0, day_volatility / np.sqrt(2))
+
+@lru_cache(maxsize=1024)
+def rolled_up_block_bars(symbol: str, interval_ms: int, block: int, seed: int) -> dict:
+    '''
+    Util function to aggregate base interval bars into the interval_ms bars starting in a block,
+    with the rollup engine of live data (exchange day aligned daily bars included)
+    Cached apart from generated blocks, which would otherwise evict the base bars they need
+    '''
+    # pylint: disable=import-outside-toplevel
+    from src.processes.rollups import rollup_arrays, bucket_end
+
+    block_ms = get_block_ms(interval_ms)
+    start = block * block_ms
+    end = bucket_end(start + block_ms - 1, interval_ms)
+    base = synthetic_bars(start, end, BASE_INTERVAL_MS, symbol, seed)
+    arrays = {field: base[short] for field, short in LOG_FIELDS.items()}
+    columns = rollup_arrays(arrays, interval_ms)
+    starting = columns['time'] >= start
+    bars = {short: columns[field][starting] for field, short in LOG_FIELDS.items()}
+    bars['n'] = bars['n'].astype(np.int64)
+    return bars
+
+def block_bars(symbol: str, interval_ms: int, block: int, seed: int) -> dict:
+    '''Util function to return the bars of one block in polygon.io field names'''
+    if is_rolled_up(interval_ms):
+        return rolled_up_block_bars(symbol, interval_ms, block, seed)
+    return walk_block_bars(symbol, interval_ms, block, seed)
+
+@lru_cache(maxsize=256)
+def walk_block_bars(symbol: str, interval_ms: int, block: int, seed: int) -> dict:
+    '''
+    Util function to generate the random-walk bars of one base (or finer) interval block
+    Prices follow the seeded trend, with a walk bridged between seeded deviations at the block
+    boundaries, so blocks are generated independently yet consecutive blocks connect
+    '''
+    block_ms = get_block_ms(interval_ms)
+    steps = block_ms // interval_ms
+    symbol_hash = zlib.crc32(symbol.encode())
+    rng = np.random.default_rng([seed, symbol_hash, interval_ms, block % 2 ** 32])
+    volatility = MINUTE_VOLATILITY * np.sqrt(interval_ms / 60000)
+
+    block_start = block * block_ms
+    first = boundary_noise(symbol_hash, block_start, seed)
+    last = boundary_noise(symbol_hash, block_start + block_ms, seed)
+    progress = np.arange(1, steps + 1) / steps
+    walk = np.cumsum(rng.normal(0, volatility, steps))
+    # Brownian bridge: the walk pinned to zero at the block end, drifting from first to last
+    deviation = first + progress * (last - first) + walk - progress * walk[-1]
+    close_times = block_start + np.arange(1, steps + 1, dtype=np.int64) * interval_ms
+    close = np.exp(trend_prices(symbol_hash, close_times, seed) + deviation)
+    open_ = np.concatenate((
+        np.exp(trend_prices(symbol_hash, np.array([block_start]), seed) + first), close[:-1]
+    ))
+    wick = np.abs(rng.normal(0, volatility / 2, (2, steps)))
+    high = np.maximum(open_, close) * (1 + wick[0])
+    low = np.minimum(open_, close) * (1 - wick[1])
+    volume = rng.lognormal(8, 1, steps).astype(np.int64) + 1
+
+    return {
+        't': block * block_ms + np.arange(steps, dtype=np.int64) * interval_ms,
+        'o': np.round(open_, 2),
+        'c': np.round(close, 2),
+        'h': np.round(high, 2),
+        'l': np.round(low, 2),
+        'v': volume,
+        'vw': np.round((open_ + high + low + close) / 4, 4),
+        'n': volume // 100 + 1
+    }
+
+def synthetic_bars(
+    start: int, end: int, interval_ms: int, symbol: str = 'BENCH', seed: int = MOCK_SEED
+) -> dict:
+    '''Util function to return the synthetic bar arrays of every interval_ms step in [start, end]'''
+    block_ms = get_block_ms(interval_ms)
+    blocks = [
+        block_bars(symbol, interval_ms, block, seed)
+        for block in range(start // block_ms, end // block_ms + 1)
+    ] if start <= end else []
+    if not blocks:
+        return {field: np.empty(0, dtype=np.int64) for field in BAR_FIELDS}
+
+    bars = {field: np.concatenate([block[field] for block in blocks]) for field in BAR_FIELDS}
+    first, last = np.searchsorted(bars['t'], [start, end + 1])
+    return {field: values[first:last] for field, values in bars.items()}
+
+def sma_values(closes: np.ndarray, window: int) -> np.ndarray:
+    '''Util function to return the simple moving average of every close with a full window'''
+    sums = np.cumsum(np.concatenate(([0.0], closes)))
+    return (sums[window:] - sums[:-window]) / window
+
+def rsi_values(closes: np.ndarray, window: int) -> np.ndarray:
+    '''Util function to return the Wilder relative strength index of closes past the seed window'''
+    changes = np.diff(closes)
+    gains = np.maximum(changes, 0.0)
+    losses = np.maximum(-changes, 0.0)
+    average_gain = gains[:window].mean()
+    average_loss = losses[:window].mean()
+    values = []
+    for gain, loss in zip(gains[window - 1:], losses[window - 1:]):
+        if values:
+            average_gain = (average_gain * (window - 1) + gain) / window
+            average_loss = (average_loss * (window - 1) + loss) / window
+        values.append(
+            100.0 if average_loss == 0 else 100 - 100 / (1 + average_gain / average_loss)
+        )
+
+    return np.array(values)
+
+@lru_cache(maxsize=64)
+def block_columns(symbol: str, interval_ms: int, block: int, seed: int) -> dict:
+    '''
+    Util function to return the aggregate log columns of one block, oldest first
+    Indicators are computed with WARMUP_BARS of the previous bars, so they do not depend
+    on the requested range
+    '''
+    bars = block_bars(symbol, interval_ms, block, seed)
+    size = len(bars['t'])
+    history = synthetic_bars(
+        int(bars['t'][0]) - WARMUP_BARS * interval_ms, int(bars['t'][-1]), interval_ms, symbol, seed
+    )
+    columns = {field: bars[short] for field, short in LOG_FIELDS.items()}
+    columns['rsi14'] = np.round(rsi_values(history['c'], RSI_WINDOW)[-size:], 2)
+    columns['sma5'] = np.round(sma_values(history['c'], SMA_WINDOW)[-size:], 4)
+    return columns
+
+@lru_cache(maxsize=64)
+def block_analytics(symbol: str, interval_ms: int, block: int, seed: int) -> tuple:
+    '''
+    Util function to return the (time, type, details) analytics of one block, newest first
+    Patterns are detected with the pattern engine on the block and the tail of the previous one
+    '''
+    # pylint: disable=import-outside-toplevel
+    from src.processes.patterns import detect_patterns, TAIL_BARS
+
+    previous = block_columns(symbol, interval_ms, block - 1, seed)
+    current = block_columns(symbol, interval_ms, block, seed)
+    tail = min(TAIL_BARS, len(previous['time']))
+    bars = {
+        field: np.concatenate([previous[field][-tail:], current[field]]).astype(float)
+        for field in current
+    }
+
+    analytics = []
+    for pattern, (signals, details) in detect_patterns(bars).items():
+        for index in np.flatnonzero(signals[tail:]) + tail:
+            analytics.append((int(bars['time'][index]), pattern, details(index)))
+
+    return tuple(sorted(analytics, key=lambda entry: entry[0], reverse=True))
+
+def get_range(start: str, end: str, interval_ms: int) -> tuple:
+    '''Util function to return the (start, end, blocks newest first) of a mocked range'''
+    now = int(datetime.now(timezone.utc).timestamp() * 1000)
+    start_ms, end_ms = int(start), min(int(end), now)
+    block_ms = get_block_ms(interval_ms)
+    return start_ms, end_ms, range(end_ms // block_ms, start_ms // block_ms - 1, -1)
+
+def mocked_aggregate_logs(
+    symbol: str, start: str, end: str, interval: str, seed: int = MOCK_SEED
+):
+    '''
+    Util generator that yields synthetic aggregate logs within range, newest first
+    Ranges are capped at the current time, fetchTime is the end of each bar
+    '''
+    interval_ms = interval_to_ms(interval)
+    start_ms, end_ms, blocks = get_range(start, end, interval_ms)
+    if start_ms > end_ms:
+        return
+
+    for block in blocks:
+        columns = block_columns(symbol, interval_ms, block, seed)
+        first, last = np.searchsorted(columns['time'], [start_ms, end_ms + 1])
+        values = {field: column[first:last][::-1].tolist() for field, column in columns.items()}
+        for row in zip(*values.values()):
+            log = dict(zip(values, row))
+            log.update({
+                'time': str(log['time']),
+                'fetchTime': str(log['time'] + interval_ms),
+                'symbol': symbol,
+                'interval': interval,
+                'options': '{}',
+                'details': ''
+            })
+            yield log
+
+def mocked_analytics(
+    symbol: str, start: str, end: str, interval: str, seed: int = MOCK_SEED
+):
+    '''Util generator that yields analytics detected on synthetic bars within range, newest first'''
+    # pylint: disable=import-outside-toplevel
+    from src.processes.patterns import EXPIRATION_BARS
+
+    interval_ms = interval_to_ms(interval)
+    start_ms, end_ms, blocks = get_range(start, end, interval_ms)
+    if start_ms > end_ms:
+        return
+
+    for block in blocks:
+        for time, pattern, details in block_analytics(symbol, interval_ms, block, seed):
+            if start_ms <= time <= end_ms:
+                yield {
+                    'time': str(time),
+                    'expiration': str(time + EXPIRATION_BARS[pattern] * interval_ms),
+                    'type': pattern,
+                    'interval': interval,
+                    'details': details,
+                    'symbol': symbol
+                }
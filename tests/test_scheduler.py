@@ -0,0 +1,69 @@
+'''
+Tests of the ingestion scheduler session handling, driven by a fake market clock
+'''
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from src.processes import scheduler
+from src.utils.market_calendar import market_calendar
+
+# Tuesday 2026-03-10, the extended session opens at 04:00 America/New_York (08:00 UTC)
+MARKET_OPEN = datetime(2026, 3, 10, 8, 0, tzinfo=timezone.utc)
+
+class FakeClock:
+    '''Market clock and monotonic clock stand-in only moving forward when sleeps are awaited'''
+    simulated = True
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self.elapsed = 0.0
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def to_real(self, seconds: float) -> float:
+        return seconds
+
+    async def sleep(self, seconds: float):
+        self.elapsed += max(seconds, 0.0)
+        if self.elapsed > 86400:
+            raise AssertionError(f'No poll before {self.now().isoformat()}')
+
+class RoundsDone(Exception):
+    '''Raised to stop the scheduler loop once enough rounds ran'''
+
+@pytest.mark.parametrize('offset', [-600, -1, 0, 1, 60])
+def test_session_is_open_from_the_open(offset):
+    today = MARKET_OPEN + timedelta(seconds=offset)
+    assert scheduler.is_market_closed(today) == (offset < 0)
+
+def test_poll_grace_after_the_close():
+    close = market_calendar.get_session(MARKET_OPEN)[1]
+    assert not scheduler.is_market_closed(close + timedelta(seconds=scheduler.POLL_OFFSET))
+    assert scheduler.is_market_closed(close + timedelta(seconds=scheduler.POLL_OFFSET + 1))
+
+def test_scheduler_polls_the_session_it_waited_for(monkeypatch):
+    fake_clock = FakeClock(MARKET_OPEN - timedelta(minutes=30))
+    rounds = []
+
+    async def process_market_data(jobs, today, workers):
+        rounds.append(today)
+        if len(rounds) == 3:
+            raise RoundsDone()
+
+    monkeypatch.setattr(scheduler, 'market_clock', fake_clock)
+    monkeypatch.setattr(scheduler, 'clock', fake_clock)
+    monkeypatch.setattr(scheduler, 'asyncio', SimpleNamespace(sleep=fake_clock.sleep))
+    monkeypatch.setattr(scheduler, 'process_market_data', process_market_data)
+
+    ingestion = scheduler.IngestionScheduler(scheduler.parse_watchlist('SPY:minute'))
+    with pytest.raises(RoundsDone):
+        asyncio.run(ingestion.run())
+
+    first_poll = MARKET_OPEN + timedelta(seconds=scheduler.POLL_OFFSET)
+    assert rounds == [first_poll + timedelta(minutes=minutes) for minutes in range(3)]